@@ -0,0 +1,314 @@
+"""
+Cảnh báo theo danh sách theo dõi, cập nhật tăng dần theo từng phiên mới
+Mỗi mã giữ trạng thái chỉ báo (MA, ADX, KL/TB20) dạng cửa sổ trượt: một phiên mới
+chỉ tốn O(1) và chỉ các điều kiện của mã đó được kiểm tra lại.
+Chi phí quét = số phiên mới x số điều kiện của mã có phiên mới, không phụ thuộc độ dài lịch sử.
+
+Tính năng cho một người dùng: app không có tài khoản nên mọi phiên dùng chung một danh sách
+điều kiện (alerts.json, giống config.json). Nhiều worker cùng chạy thì mỗi lần sửa đọc lại file
+trước khi ghi (edit_conditions) và mỗi worker đồng bộ lại từ file (AlertEngine.sync).
+"""
+
+import os
+import json
+import math
+import uuid
+import threading
+from collections import defaultdict, deque
+from indicators import MA_WINDOWS, ADX_PERIOD, VOLUME_WINDOW
+
+# File lưu điều kiện cảnh báo
+ALERTS_FILE = "alerts.json"
+
+# Chỉ báo có thể đặt điều kiện
+INDICATORS = {
+    "close": "Giá đóng cửa",
+    "change_pct": "Thay đổi %",
+    "volume_ratio": "KL / TB20 (%)",
+    "adx": "ADX(14)",
+    **{f"ma{w}": f"MA{w}" for w in MA_WINDOWS},
+}
+
+OPERATORS = {
+    ">": "lớn hơn",
+    "<": "nhỏ hơn",
+    "cross_above": "cắt lên",
+    "cross_below": "cắt xuống",
+}
+
+
+class _Window:
+    """Cửa sổ trượt kích thước cố định, giữ tổng để tính trung bình O(1)"""
+
+    def __init__(self, size):
+        self.size = size
+        self.buffer = [0.0] * size
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.nan_count = 0
+
+    def push(self, value):
+        old = self.buffer[self.position]
+        if self.count == self.size:
+            if math.isnan(old):
+                self.nan_count -= 1
+            else:
+                self.total -= old
+        else:
+            self.count += 1
+        if math.isnan(value):
+            self.nan_count += 1
+        else:
+            self.total += value
+        self.buffer[self.position] = value
+        self.position = (self.position + 1) % self.size
+
+    def mean(self):
+        if self.count < self.size or self.nan_count:
+            return None
+        return self.total / self.size
+
+
+class IndicatorState:
+    """Trạng thái chỉ báo của một mã, cập nhật từng phiên (cùng công thức với indicators.py)"""
+
+    def __init__(self):
+        self.ma = {w: _Window(w) for w in MA_WINDOWS}
+        self.volume = _Window(VOLUME_WINDOW)
+        self.tr = _Window(ADX_PERIOD)
+        self.plus_dm = _Window(ADX_PERIOD)
+        self.minus_dm = _Window(ADX_PERIOD)
+        self.dx = _Window(ADX_PERIOD)
+        self.last_bar = None
+        self.last_date = None
+        self.values = {}
+        self.prev_values = {}
+
+    def update(self, date, bar):
+        """Thêm một phiên (bar: dict open/high/low/close/volume)"""
+        high, low, close, volume = float(bar["high"]), float(bar["low"]), float(bar["close"]), float(bar["volume"])
+        prev = self.last_bar
+
+        # True Range, +DM, -DM
+        if prev is None:
+            tr, plus_dm, minus_dm = high - low, 0.0, 0.0
+        else:
+            tr = max(high - low, abs(high - prev["close"]), abs(low - prev["close"]))
+            up, down = high - prev["high"], prev["low"] - low
+            plus_dm = up if up > down and up > 0 else 0.0
+            minus_dm = down if down > up and down > 0 else 0.0
+        self.tr.push(tr)
+        self.plus_dm.push(plus_dm)
+        self.minus_dm.push(minus_dm)
+
+        atr = self.tr.mean()
+        if atr is not None:
+            plus_di = 100 * self.plus_dm.mean() / atr if atr else math.nan
+            minus_di = 100 * self.minus_dm.mean() / atr if atr else math.nan
+            total = plus_di + minus_di
+            self.dx.push(100 * abs(plus_di - minus_di) / total if total else math.nan)
+
+        self.volume.push(volume)
+        for window in self.ma.values():
+            window.push(close)
+
+        avg_volume = self.volume.mean()
+        values = {
+            "close": close,
+            "change_pct": (close / prev["close"] - 1) * 100 if prev and prev["close"] else 0.0,
+            "volume_ratio": volume / avg_volume * 100 if avg_volume else None,
+            "adx": self.dx.mean(),
+        }
+        values.update({f"ma{w}": window.mean() for w, window in self.ma.items()})
+
+        self.prev_values, self.values = self.values, values
+        self.last_bar = {"high": high, "low": low, "close": close}
+        self.last_date = date
+
+
+def _operand(values, reference):
+    """Giá trị vế phải: số cố định hoặc tên chỉ báo khác (vd: close cắt lên ma20)"""
+    if isinstance(reference, str):
+        return values.get(reference)
+    return reference
+
+
+def describe(condition):
+    """Mô tả điều kiện dạng dễ đọc"""
+    reference = condition["value"]
+    reference = INDICATORS.get(reference, reference) if isinstance(reference, str) else f"{reference:g}"
+    return f"{condition['symbol']}: {INDICATORS[condition['indicator']]} {OPERATORS[condition['op']]} {reference}"
+
+
+def make_condition(symbol, indicator, op, value):
+    """Tạo điều kiện mới; value là số hoặc tên chỉ báo"""
+    if indicator not in INDICATORS:
+        raise ValueError(f"Chỉ báo không hợp lệ: {indicator}")
+    if op not in OPERATORS:
+        raise ValueError(f"Phép so sánh không hợp lệ: {op}")
+    if isinstance(value, str):
+        value = value.strip().lower()
+        if value not in INDICATORS:
+            value = float(value.replace(",", "."))
+    return {"id": uuid.uuid4().hex[:8], "symbol": symbol.upper(), "indicator": indicator, "op": op, "value": value}
+
+
+class AlertEngine:
+    """Quản lý điều kiện, trạng thái chỉ báo theo mã và danh sách cảnh báo đã kích hoạt"""
+
+    def __init__(self, conditions=(), feed_size=200):
+        self.states = {}
+        self.conditions = {}
+        self._by_symbol = defaultdict(list)
+        # Trạng thái đúng/sai lần kiểm tra trước của từng điều kiện (để chỉ báo khi chuyển sang đúng)
+        self._active = {}
+        self.feed = deque(maxlen=feed_size)
+        self.lock = threading.RLock()
+        for condition in conditions:
+            self.add_condition(condition)
+
+    def symbols(self):
+        """Các mã đang có điều kiện"""
+        return sorted(s for s, items in self._by_symbol.items() if items)
+
+    def add_condition(self, condition):
+        with self.lock:
+            self.conditions[condition["id"]] = condition
+            self._by_symbol[condition["symbol"]].append(condition)
+            state = self.states.get(condition["symbol"])
+            if state is not None and state.values:
+                self._evaluate(condition, state)
+
+    def sync(self, conditions):
+        """Đồng bộ với danh sách điều kiện đã lưu (worker khác có thể đã thêm/xóa)"""
+        with self.lock:
+            wanted = {c["id"]: c for c in conditions}
+            for condition_id in [c for c in self.conditions if c not in wanted]:
+                self.remove_condition(condition_id)
+            for condition_id, condition in wanted.items():
+                if condition_id not in self.conditions:
+                    self.add_condition(condition)
+
+    def remove_condition(self, condition_id):
+        with self.lock:
+            condition = self.conditions.pop(condition_id, None)
+            if condition:
+                self._by_symbol[condition["symbol"]].remove(condition)
+                self._active.pop(condition_id, None)
+
+    def _evaluate(self, condition, state):
+        """Kiểm tra một điều kiện trên trạng thái hiện tại; trả về cảnh báo nếu vừa kích hoạt"""
+        value = state.values.get(condition["indicator"])
+        reference = _operand(state.values, condition["value"])
+        if value is None or reference is None:
+            return None
+
+        op = condition["op"]
+        if op in (">", "<"):
+            hit = value > reference if op == ">" else value < reference
+            was_active = self._active.get(condition["id"], False)
+            self._active[condition["id"]] = hit
+            if not hit or was_active:
+                return None
+        else:
+            prev_value = state.prev_values.get(condition["indicator"])
+            prev_reference = _operand(state.prev_values, condition["value"])
+            if prev_value is None or prev_reference is None:
+                return None
+            if op == "cross_above":
+                hit = prev_value <= prev_reference and value > reference
+            else:
+                hit = prev_value >= prev_reference and value < reference
+            if not hit:
+                return None
+
+        alert = {
+            "symbol": condition["symbol"],
+            "date": state.last_date,
+            "condition_id": condition["id"],
+            "message": f"{describe(condition)} (hiện tại {value:,.2f})",
+        }
+        self.feed.appendleft(alert)
+        return alert
+
+    def on_bar(self, symbol, date, bar, evaluate=True):
+        """Nạp một phiên mới của một mã; chỉ kiểm tra các điều kiện của mã đó"""
+        with self.lock:
+            state = self.states.setdefault(symbol, IndicatorState())
+            if state.last_date is not None and date <= state.last_date:
+                return []
+            state.update(date, bar)
+            if not evaluate:
+                return []
+            alerts = [self._evaluate(c, state) for c in self._by_symbol.get(symbol, [])]
+            return [a for a in alerts if a]
+
+    def update(self, symbol, price_data):
+        """
+        Nạp các phiên chưa có của một mã từ DataFrame giá (định dạng vnstock)
+        Lần đầu: nạp toàn bộ lịch sử (không báo), chỉ kiểm tra ở phiên cuối
+        Các lần sau: chỉ nạp phần phiên mới; dữ liệu phải chứa phiên đã nạp gần nhất,
+        không thì (thiếu phiên ở giữa) trạng thái được nạp lại từ đầu như lần đầu
+        """
+        if price_data is None or price_data.empty:
+            return []
+        dates = price_data['time'] if 'time' in price_data.columns else price_data.index.to_series()
+        dates = [str(d)[:10] for d in dates]
+
+        with self.lock:
+            state = self.states.get(symbol)
+            last_date = state.last_date if state else None
+            start = 0
+            if last_date is not None:
+                # Bỏ qua các phiên đã nạp (tìm từ cuối vì thường chỉ có vài phiên mới)
+                start = len(dates)
+                while start > 0 and dates[start - 1] > last_date:
+                    start -= 1
+                if start < len(dates) and (start == 0 or dates[start - 1] != last_date):
+                    # Không nối tiếp được phiên đã nạp: cửa sổ trượt sẽ trộn dữ liệu không liền mạch
+                    self.states[symbol] = IndicatorState()
+                    start, last_date = 0, None
+            new_rows = price_data.iloc[start:]
+            new_dates = dates[start:]
+            warm_up = last_date is None
+
+            alerts = []
+            for i, (date, bar) in enumerate(zip(new_dates, new_rows.to_dict('records'))):
+                is_last = i == len(new_dates) - 1
+                alerts += self.on_bar(symbol, date, bar, evaluate=not warm_up or is_last)
+            return alerts
+
+
+def load_conditions(path=ALERTS_FILE):
+    """Đọc danh sách điều kiện từ file"""
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+    return []
+
+
+def save_conditions(conditions, path=ALERTS_FILE):
+    """Lưu danh sách điều kiện vào file (ghi file tạm rồi đổi tên, không để file dở dang)"""
+    tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(list(conditions), f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return True
+    except OSError:
+        return False
+
+
+def edit_conditions(add=None, remove=None, path=ALERTS_FILE):
+    """
+    Thêm và/hoặc xóa một điều kiện trên file; đọc lại file ngay trước khi ghi
+    để không đè thay đổi của worker khác. Trả về danh sách mới, None nếu không ghi được
+    """
+    conditions = [c for c in load_conditions(path) if c["id"] != remove]
+    if add is not None:
+        conditions.append(add)
+    return conditions if save_conditions(conditions, path) else None
@@ -5,12 +5,18 @@ Chạy: streamlit run app.py
 
 import streamlit as st
 import pandas as pd
-from vnstock import Vnstock
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
 from openai import OpenAI
 import json
 import os
+from market_data import fetch_price_history, fetch_price_histories, fetch_company_overview
+from transport import chat_completion
+from indicators import latest_indicators
+import chimcut
+from symbol_directory import get_directory
+from statement_store import GROWTH_LABELS, get_statements, is_fundamental_question
+from alerts import AlertEngine, INDICATORS, OPERATORS, describe, make_condition, load_conditions, edit_conditions
 
 # Cấu hình trang
 st.set_page_config(
@@ -22,6 +28,9 @@ st.set_page_config(
 # File lưu cấu hình
 CONFIG_FILE = "config.json"
 
+# Số ngày lịch sử khi nạp trạng thái cảnh báo của một mã (đủ cho MA200)
+ALERT_HISTORY_DAYS = 400
+
 def load_config():
     """Đọc cấu hình từ file"""
     if os.path.exists(CONFIG_FILE):
@@ -41,6 +50,14 @@ def save_config(config):
     except:
         return False
 
+@st.cache_resource
+def get_alert_engine():
+    """
+    Bộ cảnh báo dùng chung cho mọi phiên (giữ trạng thái chỉ báo giữa các lần rerun)
+    Cảnh báo là tính năng cho một người dùng: mọi phiên thấy và sửa cùng một danh sách điều kiện
+    """
+    return AlertEngine(load_conditions())
+
 # Title
 st.title("📈 Trợ lý AI stock")
 st.markdown("---")
@@ -58,6 +75,15 @@ if "current_symbol" not in st.session_state:
     st.session_state.current_symbol = None
 if "price_data" not in st.session_state:
     st.session_state.price_data = None
+if "chimcut_results" not in st.session_state:
+    st.session_state.chimcut_results = {}
+if "symbol_input" not in st.session_state:
+    st.session_state.symbol_input = "VNM"
+
+def pick_symbol(code):
+    """Chọn mã từ gợi ý/tìm nhanh: điền vào ô nhập và tra cứu luôn"""
+    st.session_state.symbol_input = code
+    st.session_state.pending_lookup = True
 
 # Sidebar
 st.sidebar.header("⚙️ Cài đặt")
@@ -80,7 +106,8 @@ with st.sidebar.expander("🔑 Cấu hình OpenAI API", expanded=not st.session_
                 try:
                     # Test kết nối
                     test_client = OpenAI(api_key=api_key)
-                    test_response = test_client.chat.completions.create(
+                    test_response = chat_completion(
+                        test_client,
                         model="gpt-4o-mini",
                         messages=[{"role": "user", "content": "test"}],
                         max_tokens=5
@@ -109,10 +136,25 @@ with st.sidebar.expander("🔑 Cấu hình OpenAI API", expanded=not st.session_
 
 st.sidebar.markdown("---")
 
+# Danh bạ mã (cache trên đĩa, làm mới mỗi ngày); None nếu không tải được
+symbol_directory = get_directory()
+
+# Tìm nhanh: selectbox lọc ngay khi gõ (mã hoặc tên công ty)
+if symbol_directory is not None:
+    st.sidebar.selectbox(
+        "🔎 Tìm nhanh",
+        symbol_directory.tickers,
+        index=None,
+        format_func=symbol_directory.label,
+        placeholder="Gõ mã hoặc tên công ty...",
+        key="quick_pick",
+        on_change=lambda: st.session_state.quick_pick and pick_symbol(st.session_state.quick_pick)
+    )
+
 # Form để có thể nhấn Enter
 with st.sidebar.form(key="search_form"):
-    # Input mã chứng khoán
-    symbol = st.text_input("Nhập mã chứng khoán", value="VNM").upper()
+    # Input mã chứng khoán (hoặc tên công ty, vd: "hòa phát")
+    symbol = st.text_input("Nhập mã chứng khoán", key="symbol_input").strip().upper()
 
     # Chọn nguồn dữ liệu (mặc định TCBS)
     source = st.selectbox("Nguồn dữ liệu", ["TCBS", "VCI", "MSN"])
@@ -125,16 +167,78 @@ with st.sidebar.form(key="search_form"):
     # Button để lấy dữ liệu
     submit_button = st.form_submit_button("🔍 Tra cứu", type="primary", use_container_width=True)
 
+# Cảnh báo theo danh sách theo dõi (một người dùng, lưu trong alerts.json)
+alert_engine = get_alert_engine()
+# Worker khác có thể đã sửa alerts.json: đồng bộ lại mỗi lần chạy (file nhỏ)
+alert_engine.sync(load_conditions())
+with st.sidebar.expander("🔔 Cảnh báo", expanded=bool(alert_engine.feed)):
+    st.caption("Danh sách cảnh báo dùng chung cho mọi phiên mở app (dành cho một người dùng)")
+    with st.form(key="alert_form", clear_on_submit=True):
+        alert_symbol = st.text_input("Mã", value=symbol)
+        alert_indicator = st.selectbox("Chỉ báo", list(INDICATORS), format_func=INDICATORS.get)
+        alert_op = st.selectbox("Điều kiện", list(OPERATORS), format_func=OPERATORS.get)
+        alert_value = st.text_input("Giá trị (số hoặc chỉ báo, vd: 30, ma20)", value="30")
+        if st.form_submit_button("➕ Thêm điều kiện", use_container_width=True):
+            try:
+                conditions = edit_conditions(add=make_condition(alert_symbol, alert_indicator, alert_op, alert_value))
+                if conditions is None:
+                    st.error("❌ Không lưu được điều kiện vào file")
+                else:
+                    alert_engine.sync(conditions)
+            except ValueError as e:
+                st.error(f"❌ {str(e)}")
+    
+    for condition in list(alert_engine.conditions.values()):
+        col1, col2 = st.columns([4, 1])
+        col1.caption(describe(condition))
+        if col2.button("🗑️", key=f"delete_alert_{condition['id']}"):
+            conditions = edit_conditions(remove=condition["id"])
+            alert_engine.sync(conditions if conditions is not None else load_conditions())
+            st.rerun()
+    
+    if alert_engine.conditions and st.button("🔄 Kiểm tra cảnh báo", use_container_width=True, key="check_alerts"):
+        watched = alert_engine.symbols()
+        # Mã đã có trạng thái chỉ tải từ phiên đã nạp gần nhất (kể cả sau kỳ nghỉ dài);
+        # mã mới hoặc bỏ lâu quá thì tải đủ lịch sử cho MA200
+        warm = [s for s in watched if s in alert_engine.states]
+        cold = [s for s in watched if s not in alert_engine.states]
+        gap = max((end_date - datetime.strptime(alert_engine.states[s].last_date, '%Y-%m-%d')).days for s in warm) if warm else 0
+        with st.spinner(f"Đang kiểm tra {len(watched)} mã..."):
+            histories, _ = fetch_price_histories(warm, source=source, days=min(gap + 5, ALERT_HISTORY_DAYS))
+            cold_histories, _ = fetch_price_histories(cold, source=source, days=ALERT_HISTORY_DAYS)
+            histories.update(cold_histories)
+            for code, data in histories.items():
+                alert_engine.update(code, data)
+    
+    if alert_engine.feed:
+        st.markdown("**Cảnh báo gần đây**")
+        for alert in list(alert_engine.feed)[:20]:
+            st.warning(f"{alert['date']} · {alert['message']}")
+
+# Kiểm tra mã với danh bạ trước khi tải dữ liệu (gõ sai không tốn lượt gọi mạng)
+lookup = submit_button or st.session_state.pop("pending_lookup", False)
+if lookup and symbol_directory is not None:
+    resolved = symbol_directory.resolve(symbol)
+    if resolved is None:
+        lookup = False
+        st.error(f"❌ Không tìm thấy mã {symbol}")
+        suggestions = symbol_directory.search(symbol, limit=8)
+        if suggestions:
+            st.markdown("**Có phải bạn muốn tìm:**")
+            suggestion_cols = st.columns(4)
+            for i, code in enumerate(suggestions):
+                suggestion_cols[i % 4].button(symbol_directory.label(code), key=f"suggest_{code}",
+                                              on_click=pick_symbol, args=(code,), use_container_width=True)
+    else:
+        symbol = resolved
+
 # Xử lý khi nhấn button hoặc Enter
-if submit_button:
+if lookup:
     # Lưu symbol vào session state
     st.session_state.current_symbol = symbol
     
     try:
         with st.spinner(f"Đang tải dữ liệu {symbol}..."):
-            # Khởi tạo
-            stock = Vnstock().stock(symbol=symbol, source=source)
-            
             # Tab layout
             tab1, tab2, tab3, tab4, tab5 = st.tabs(["📊 Giá & Biểu đồ", "🏢 Thông tin công ty", "💰 Tài chính", "📋 Chỉ số", "🤖 AI Phân tích"])
             
@@ -144,13 +248,13 @@ if submit_button:
                 
                 # Lấy dữ liệu giá
                 try:
-                    price_data = stock.quote.history(
-                        start=start_date.strftime('%Y-%m-%d'),
-                        end=end_date.strftime('%Y-%m-%d'),
-                        interval='1D'
-                    )
+                    # Đọc từ snapshot theo ngày nếu có, không thì tải từ vnstock
+                    price_data = fetch_price_history(symbol, source=source, days=days, end_date=end_date)
                     # Lưu vào session state
                     st.session_state.price_data = price_data
+                    # Mã đang có điều kiện cảnh báo: nạp luôn phiên mới (không tải thêm)
+                    if symbol in alert_engine.symbols():
+                        alert_engine.update(symbol, price_data)
                 except Exception as e:
                     st.error(f"Lỗi khi lấy dữ liệu giá: {str(e)}")
                     st.info(f"💡 Thử đổi nguồn dữ liệu sang TCBS hoặc MSN")
@@ -226,7 +330,7 @@ if submit_button:
             with tab2:
                 st.subheader(f"Thông tin công ty {symbol}")
                 try:
-                    company_info = stock.company.overview()
+                    company_info = fetch_company_overview(symbol, source=source)
                     if not company_info.empty:
                         st.dataframe(company_info, use_container_width=True)
                     else:
@@ -234,39 +338,69 @@ if submit_button:
                 except Exception as e:
                     st.error(f"Lỗi khi lấy thông tin công ty: {str(e)}")
             
+            # Báo cáo tài chính mọi quý từ kho (chỉ tải thêm khi có quý mới), dùng cho Tab 3 và Tab 4
+            statements_error = None
+            try:
+                statements = get_statements(symbol, source=source)
+            except Exception as e:
+                statements, statements_error = None, e
+            
             # TAB 3: Báo cáo tài chính
             with tab3:
                 st.subheader("Báo cáo tài chính")
                 
-                col1, col2 = st.columns(2)
-                
-                with col1:
-                    st.markdown("**Bảng cân đối kế toán**")
-                    try:
-                        balance_sheet = stock.finance.balance_sheet(period='quarter', lang='vi')
-                        st.dataframe(balance_sheet.head(10), use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Lỗi: {str(e)}")
-                
-                with col2:
-                    st.markdown("**Báo cáo kết quả kinh doanh**")
-                    try:
-                        income = stock.finance.income_statement(period='quarter', lang='vi')
-                        st.dataframe(income.head(10), use_container_width=True)
-                    except Exception as e:
-                        st.error(f"Lỗi: {str(e)}")
+                if statements is None:
+                    st.error(f"Lỗi: {str(statements_error)}")
+                else:
+                    col1, col2 = st.columns(2)
+                    
+                    # Mỗi báo cáo hiển thị riêng: một báo cáo lỗi không làm mất các báo cáo còn lại
+                    with col1:
+                        st.markdown("**Bảng cân đối kế toán**")
+                        try:
+                            if 'balance_sheet' in statements.reports():
+                                st.dataframe(statements.view('balance_sheet'), use_container_width=True)
+                            else:
+                                st.info("Chưa tải được bảng cân đối kế toán")
+                        except Exception as e:
+                            st.error(f"Lỗi: {str(e)}")
+                    
+                    with col2:
+                        st.markdown("**Báo cáo kết quả kinh doanh**")
+                        try:
+                            if 'income_statement' in statements.reports():
+                                st.dataframe(statements.view('income_statement'), use_container_width=True)
+                            else:
+                                st.info("Chưa tải được báo cáo kết quả kinh doanh")
+                        except Exception as e:
+                            st.error(f"Lỗi: {str(e)}")
+                    
+                    # Tăng trưởng quý gần nhất (tính sẵn trong kho)
+                    for report, title in (('income_statement', "Kết quả kinh doanh"), ('balance_sheet', "Cân đối kế toán")):
+                        try:
+                            latest = statements.latest(report)
+                            if not latest.empty:
+                                period = statements.latest_period(report)
+                                st.markdown(f"**Tăng trưởng {title} Q{period[1]}/{period[0]}** (QoQ, YoY: %)")
+                                st.dataframe(latest.rename(columns=GROWTH_LABELS).round(2), use_container_width=True)
+                        except Exception as e:
+                            st.error(f"Lỗi: {str(e)}")
             
             # TAB 4: Chỉ số tài chính
             with tab4:
                 st.subheader("Chỉ số tài chính")
-                try:
-                    ratio = stock.finance.ratio(period='quarter', lang='vi')
-                    if not ratio.empty:
-                        st.dataframe(ratio.head(10), use_container_width=True)
-                    else:
-                        st.info("Không có dữ liệu chỉ số tài chính")
-                except Exception as e:
-                    st.error(f"Lỗi: {str(e)}")
+                if statements is None:
+                    st.error(f"Lỗi: {str(statements_error)}")
+                elif 'ratio' in statements.reports():
+                    try:
+                        st.dataframe(statements.view('ratio'), use_container_width=True)
+                        period = statements.latest_period('ratio')
+                        st.markdown(f"**Xu hướng chỉ số Q{period[1]}/{period[0]}** (QoQ, YoY: chênh lệch; TTM: trung bình 4 quý)")
+                        st.dataframe(statements.latest('ratio').rename(columns=GROWTH_LABELS).round(2), use_container_width=True)
+                    except Exception as e:
+                        st.error(f"Lỗi: {str(e)}")
+                else:
+                    st.info("Không có dữ liệu chỉ số tài chính")
             
             # TAB 5: AI Phân tích
             with tab5:
@@ -289,47 +423,68 @@ if st.session_state.current_symbol:
     st.subheader(f"🤖 AI Phân tích cổ phiếu {symbol}")
     
     if not st.session_state.openai_api_key:
-        st.warning("⚠️ Vui lòng nhập OpenAI API Key ở sidebar để sử dụng tính năng AI")
-    else:
-        # Kiểm tra xem có message đang chờ xử lý không
-        user_messages = [m for m in st.session_state.messages if m["symbol"] == symbol and m["role"] == "user"]
-        assistant_messages = [m for m in st.session_state.messages if m["symbol"] == symbol and m["role"] == "assistant"]
-        is_processing = len(user_messages) > len(assistant_messages)
-        
-        # Chỉ hiển thị nút khi KHÔNG đang xử lý
-        if not is_processing:
-            # Nút phân tích
-            col1, col2 = st.columns([1, 1])
-            with col1:
-                if st.button("🎯 PTKT Chim Cút", use_container_width=True, type="primary", key="ptkt_button"):
-                    auto_prompt = f"Phân tích kỹ thuật cổ phiếu {symbol} theo phương pháp Chim Cút. Hãy áp dụng CHÍNH XÁC các quy tắc về MA, ADX, Volume và đưa ra khuyến nghị cụ thể."
-                    st.session_state.messages.append({
-                        "role": "user",
-                        "content": auto_prompt,
-                        "symbol": symbol
-                    })
-                    st.rerun()
-            
-            with col2:
-                if st.button("🔄 Xóa lịch sử", use_container_width=True, key="clear_button"):
-                    st.session_state.messages = [m for m in st.session_state.messages if m["symbol"] != symbol]
-                    st.rerun()
-        
-        # Hiển thị lịch sử chat
-        for message in st.session_state.messages:
-            if message["symbol"] == symbol:
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
-        
-        # Input chat (chỉ hiện khi không đang xử lý)
-        if not is_processing:
-            if prompt := st.chat_input("Hỏi AI về cổ phiếu này...", key="chat_input"):
+        st.warning("⚠️ Vui lòng nhập OpenAI API Key ở sidebar để chat với AI (PTKT Chim Cút vẫn dùng được)")
+    
+    # Kiểm tra xem có message đang chờ xử lý không
+    user_messages = [m for m in st.session_state.messages if m["symbol"] == symbol and m["role"] == "user"]
+    assistant_messages = [m for m in st.session_state.messages if m["symbol"] == symbol and m["role"] == "assistant"]
+    is_processing = len(user_messages) > len(assistant_messages)
+    
+    # Chỉ hiển thị nút khi KHÔNG đang xử lý
+    if not is_processing:
+        # Nút phân tích
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            if st.button("🎯 PTKT Chim Cút", use_container_width=True, type="primary", key="ptkt_button"):
+                # Tính cục bộ theo bộ quy tắc Chim Cút, không cần gọi AI
+                price_data = st.session_state.price_data if st.session_state.price_data is not None else pd.DataFrame()
+                result = chimcut.evaluate(price_data)
+                st.session_state.chimcut_results[symbol] = result
                 st.session_state.messages.append({
                     "role": "user",
-                    "content": prompt,
+                    "content": f"Phân tích kỹ thuật cổ phiếu {symbol} theo phương pháp Chim Cút",
                     "symbol": symbol
                 })
+                st.session_state.messages.append({
+                    "role": "assistant",
+                    "content": chimcut.format_report(symbol, result),
+                    "symbol": symbol
+                })
+                st.rerun()
+        
+        with col2:
+            # AI chỉ viết nhận định dựa trên kết quả đã tính (prompt gọn, ít token)
+            can_narrate = bool(st.session_state.openai_api_key and st.session_state.chimcut_results.get(symbol))
+            if st.button("✍️ AI viết nhận định", use_container_width=True, key="narrative_button", disabled=not can_narrate):
+                st.session_state.messages.append({
+                    "role": "user",
+                    "content": f"Viết nhận định PTKT Chim Cút cho {symbol}",
+                    "symbol": symbol,
+                    "kind": "chimcut_narrative"
+                })
                 st.rerun()
+        
+        with col3:
+            if st.button("🔄 Xóa lịch sử", use_container_width=True, key="clear_button"):
+                st.session_state.messages = [m for m in st.session_state.messages if m["symbol"] != symbol]
+                st.session_state.chimcut_results.pop(symbol, None)
+                st.rerun()
+    
+    # Hiển thị lịch sử chat
+    for message in st.session_state.messages:
+        if message["symbol"] == symbol:
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
+    
+    # Input chat (chỉ hiện khi có API key và không đang xử lý)
+    if st.session_state.openai_api_key and not is_processing:
+        if prompt := st.chat_input("Hỏi AI về cổ phiếu này...", key="chat_input"):
+            st.session_state.messages.append({
+                "role": "user",
+                "content": prompt,
+                "symbol": symbol
+            })
+            st.rerun()
 
 # Xử lý AI response (chạy sau khi có user message)
 if st.session_state.current_symbol and st.session_state.openai_api_key:
@@ -354,6 +509,26 @@ if st.session_state.current_symbol and st.session_state.openai_api_key:
                     # Khởi tạo OpenAI client
                     client = OpenAI(api_key=st.session_state.openai_api_key)
                     
+                    # Nhận định cho kết quả PTKT đã tính sẵn: chỉ gửi JSON gọn, không gửi kiến thức/lịch sử giá
+                    if user_messages[-1].get("kind") == "chimcut_narrative":
+                        result = st.session_state.chimcut_results.get(symbol) or chimcut.evaluate(price_data)
+                        response = chat_completion(
+                            client,
+                            model="gpt-4o-mini",
+                            messages=[
+                                {"role": "system", "content": chimcut.NARRATIVE_SYSTEM_PROMPT},
+                                {"role": "user", "content": chimcut.narrative_payload(symbol, result)}
+                            ],
+                            temperature=0.5,
+                            max_tokens=500
+                        )
+                        st.session_state.messages.append({
+                            "role": "assistant",
+                            "content": response.choices[0].message.content,
+                            "symbol": symbol
+                        })
+                        st.rerun()
+                    
                     # Đọc kiến thức Chim Cút
                     import os
                     knowledge_base = ""
@@ -383,49 +558,13 @@ if st.session_state.current_symbol and st.session_state.openai_api_key:
                         change = latest['close'] - prev_close
                         change_pct = (change / prev_close * 100) if prev_close != 0 else 0
                         
-                        # Tính MA
-                        ma5 = recent_data['close'].tail(5).mean() if len(recent_data) >= 5 else None
-                        ma10 = recent_data['close'].tail(10).mean() if len(recent_data) >= 10 else None
-                        ma20 = recent_data['close'].tail(20).mean() if len(recent_data) >= 20 else None
-                        ma50 = price_data['close'].tail(50).mean() if len(price_data) >= 50 else None
-                        ma100 = price_data['close'].tail(100).mean() if len(price_data) >= 100 else None
-                        ma200 = price_data['close'].tail(200).mean() if len(price_data) >= 200 else None
-                        
-                        # Volume trung bình
-                        avg_volume_20 = recent_data['volume'].tail(20).mean() if len(recent_data) >= 20 else None
-                        volume_ratio = (latest['volume'] / avg_volume_20 * 100) if avg_volume_20 and avg_volume_20 > 0 else 0
-                        
-                        # Tính ADX đơn giản (chỉ số xu hướng)
-                        # ADX đo lường sức mạnh xu hướng (0-100)
-                        def calculate_adx(df, period=14):
-                            if len(df) < period + 1:
-                                return None
-                            
-                            # Tính True Range
-                            high_low = df['high'] - df['low']
-                            high_close = abs(df['high'] - df['close'].shift(1))
-                            low_close = abs(df['low'] - df['close'].shift(1))
-                            tr = pd.concat([high_low, high_close, low_close], axis=1).max(axis=1)
-                            
-                            # Tính +DM và -DM
-                            high_diff = df['high'].diff()
-                            low_diff = -df['low'].diff()
-                            
-                            plus_dm = high_diff.where((high_diff > low_diff) & (high_diff > 0), 0)
-                            minus_dm = low_diff.where((low_diff > high_diff) & (low_diff > 0), 0)
-                            
-                            # Smooth
-                            atr = tr.rolling(window=period).mean()
-                            plus_di = 100 * (plus_dm.rolling(window=period).mean() / atr)
-                            minus_di = 100 * (minus_dm.rolling(window=period).mean() / atr)
-                            
-                            # ADX
-                            dx = 100 * abs(plus_di - minus_di) / (plus_di + minus_di)
-                            adx = dx.rolling(window=period).mean()
-                            
-                            return adx.iloc[-1] if not adx.empty else None
-                        
-                        adx = calculate_adx(price_data, 14)
+                        # Tính MA, volume trung bình và ADX (dùng chung module indicators)
+                        ind = latest_indicators(price_data)
+                        ma5, ma10, ma20 = ind["ma5"], ind["ma10"], ind["ma20"]
+                        ma50, ma100, ma200 = ind["ma50"], ind["ma100"], ind["ma200"]
+                        avg_volume_20 = ind["avg_volume_20"]
+                        volume_ratio = ind["volume_ratio"]
+                        adx = ind["adx"]
                         
                         # Lịch sử giá 365 ngày gần nhất (1 năm)
                         history_365d = price_data.tail(365)[['close', 'volume']].copy()
@@ -490,6 +629,20 @@ LỊCH SỬ GIÁ & KHỐI LƯỢNG:
 {history_str}
 """
                     
+                    # Câu hỏi Chim Cút: gửi kèm kết quả bộ quy tắc đã tính để AI không phải tự tính ngưỡng
+                    if not price_data.empty and ("chim cút" in prompt.lower() or "ptkt" in prompt.lower()):
+                        result = chimcut.evaluate(price_data)
+                        stock_info += f"\nKẾT QUẢ BỘ QUY TẮC CHIM CÚT (đã tính sẵn, dùng đúng các giá trị này):\n{chimcut.narrative_payload(symbol, result)}\n"
+                    
+                    # Câu hỏi phân tích cơ bản: gửi kèm số liệu BCTC trong kho (tăng trưởng, TTM đã tính sẵn)
+                    if is_fundamental_question(prompt):
+                        try:
+                            fundamentals = get_statements(symbol, source=source).summary()
+                        except Exception:
+                            fundamentals = ""
+                        if fundamentals:
+                            stock_info += f"\nSỐ LIỆU TÀI CHÍNH THEO QUÝ (đã tính sẵn, dùng đúng các giá trị này):\n{fundamentals}\n"
+                    
                     analysis_data = {
                         "symbol": symbol,
                         "latest_price": price_data.iloc[-1].to_dict() if not price_data.empty else {},
@@ -503,8 +656,6 @@ LỊCH SỬ GIÁ & KHỐI LƯỢNG:
 ═══════════════════════════════════════════════════════
 {knowledge_base}
 
-═══════════════════════════════════════════════════════
-{stock_info}
 ═══════════════════════════════════════════════════════
 {stock_info}
 ═══════════════════════════════════════════════════════
@@ -544,7 +695,8 @@ CẤU TRÚC TRẢ LỜI:
 
 Hãy phân tích CHUYÊN NGHIỆP theo phương pháp Chim Cút!"""
                     
-                    response = client.chat.completions.create(
+                    response = chat_completion(
+                        client,
                         model="gpt-4o-mini",
                         messages=[
                             {"role": "system", "content": system_prompt},
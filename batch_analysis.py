@@ -0,0 +1,116 @@
+"""
+Phân tích AI so sánh nhiều mã trong MỘT lời gọi
+- Tải giá các mã song song (market_data.fetch_price_histories)
+- Tính chỉ báo cho cả nhóm trong một lượt trên ma trận ngày x mã
+- Mỗi mã gói thành một dòng đặc trưng ngắn, dùng chung một bản kiến thức trong prompt
+Chi phí so sánh N mã tăng theo số dòng đặc trưng, không phải N lần prompt đầy đủ
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from market_data import build_field_matrix
+from indicators import moving_average, calculate_adx, ADX_PERIOD, VOLUME_WINDOW
+from chimcut import adx_level
+from transport import chat_completion
+
+# Giới hạn số mã mỗi lần so sánh để câu trả lời còn đọc được
+MAX_SYMBOLS = 10
+KNOWLEDGE_FILE = "ai_knowledge.txt"
+
+# Cột đặc trưng gửi cho AI (tên ngắn để tiết kiệm token)
+FEATURE_LABELS = {
+    "close": "Giá",
+    "chg_1d": "%1P",
+    "chg_5d": "%5P",
+    "chg_20d": "%20P",
+    "chg_60d": "%60P",
+    "vs_ma20": "%vsMA20",
+    "vs_ma50": "%vsMA50",
+    "vs_ma200": "%vsMA200",
+    "adx": "ADX",
+    "vol_ratio": "KL/TB20%",
+    "volatility_20d": "BiếnĐộng20P%",
+    "from_high_1y": "%từĐỉnh1N",
+    "from_low_1y": "%từĐáy1N",
+}
+
+
+def _last(frame):
+    """Giá trị cuối cùng có dữ liệu của từng mã"""
+    return frame.ffill().iloc[-1]
+
+
+def feature_table(histories):
+    """Bảng đặc trưng mỗi mã một dòng, tính vector hóa trên ma trận ngày x mã"""
+    close = build_field_matrix(histories, 'close')
+    if close.empty:
+        return pd.DataFrame(columns=list(FEATURE_LABELS))
+    high = build_field_matrix(histories, 'high').reindex(close.index)
+    low = build_field_matrix(histories, 'low').reindex(close.index)
+    volume = build_field_matrix(histories, 'volume').reindex(close.index)
+
+    last_close = _last(close)
+    features = pd.DataFrame(index=close.columns)
+    features["close"] = last_close
+    for days in (1, 5, 20, 60):
+        features[f"chg_{days}d"] = (last_close / _last(close.shift(days)) - 1) * 100
+    for window in (20, 50, 200):
+        features[f"vs_ma{window}"] = (last_close / _last(moving_average(close, window)) - 1) * 100
+
+    features["adx"] = _last(calculate_adx(high, low, close, ADX_PERIOD))
+    features["vol_ratio"] = _last(volume) / _last(moving_average(volume, VOLUME_WINDOW)) * 100
+    returns = np.log(close / close.shift(1))
+    features["volatility_20d"] = _last(returns.rolling(20).std()) * np.sqrt(252) * 100
+
+    year = close.tail(250)
+    features["from_high_1y"] = (last_close / year.max() - 1) * 100
+    features["from_low_1y"] = (last_close / year.min() - 1) * 100
+    return features
+
+
+def build_messages(features, question, knowledge=""):
+    """Prompt gọn: kiến thức chung một lần + bảng CSV mỗi mã một dòng"""
+    table = features.rename(columns=FEATURE_LABELS).copy()
+    table["XuHướng(ADX)"] = [adx_level(None if pd.isna(v) else v) for v in features["adx"]]
+    csv = table.round(1).to_csv(index_label="Mã")
+
+    knowledge_block = f"KIẾN THỨC:\n{knowledge}\n" if knowledge else ""
+    system_prompt = f"""Bạn là chuyên gia phân tích chứng khoán Việt Nam, so sánh nhiều cổ phiếu cùng lúc.
+{knowledge_block}
+Ý nghĩa cột: %nP = thay đổi giá n phiên; %vsMAx = khoảng cách giá so với MAx; KL/TB20% = khối lượng so với TB 20 phiên;
+BiếnĐộng20P% = độ biến động năm hóa; %từĐỉnh1N/%từĐáy1N = khoảng cách tới đỉnh/đáy 1 năm.
+
+YÊU CẦU:
+- Chỉ dùng số liệu trong bảng, không bịa thêm
+- So sánh và xếp hạng các mã (xu hướng, động lượng, khối lượng, rủi ro), trình bày bảng xếp hạng ngắn
+- Nêu điểm mạnh/yếu nổi bật của từng mã trong 1-2 dòng
+- Luôn nhắc: "Đây chỉ là tham khảo, NĐT tự chịu trách nhiệm quyết định\""""
+
+    user_prompt = f"DỮ LIỆU ({len(features)} mã, phiên gần nhất):\n{csv}\nCÂU HỎI: {question}"
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def load_knowledge(path=KNOWLEDGE_FILE):
+    """Đọc file kiến thức chung (rỗng nếu không có)"""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return ""
+
+
+def compare(client, histories, question, knowledge=None, model="gpt-4o-mini"):
+    """So sánh các mã trong một lời gọi AI; trả về (câu trả lời, bảng đặc trưng, messages đã gửi)"""
+    features = feature_table(histories)
+    messages = build_messages(features, question, load_knowledge() if knowledge is None else knowledge)
+    response = chat_completion(
+        client,
+        model=model,
+        messages=messages,
+        temperature=0.5,
+        max_tokens=1500
+    )
+    return response.choices[0].message.content, features, messages
@@ -0,0 +1,299 @@
+"""
+Bộ quy tắc phân tích kỹ thuật Chim Cút chạy cục bộ (không cần AI)
+Áp dụng các ngưỡng trong knowledge/kienthucchimcut.txt (MA, ADX, khối lượng, quy tắc tổng hợp)
+và trả về kết quả có cấu trúc trong vài mili giây. AI (tùy chọn) chỉ viết phần nhận định.
+"""
+
+import json
+from indicators import latest_indicators
+
+# Ngưỡng theo kiến thức Chim Cút
+ADX_NO_TREND = 20
+ADX_STRONG = 30
+ADX_VERY_STRONG = 50
+VOLUME_HIGH = 150
+VOLUME_SPIKE = 200
+STOP_LOSS_RANGE = (0.03, 0.05)
+MIN_REWARD_RISK = 2
+ALLOCATION = [("T0", 50), ("T2", 30), ("T5", 20)]
+FIBO_LEVELS = [0.236, 0.382, 0.5, 0.618]
+FIBO_EXTENSIONS = [1.272, 1.618]
+
+BUY_RECOMMENDATIONS = ["MUA / TĂNG TỶ TRỌNG", "MUA BREAKOUT", "MUA GOM NỀN"]
+
+
+def _above(value, reference):
+    return reference is not None and value > reference
+
+
+def _below(value, reference):
+    return reference is not None and value < reference
+
+
+def adx_level(adx):
+    """Mức xu hướng theo ADX"""
+    if adx is None:
+        return "N/A"
+    if adx < ADX_NO_TREND:
+        return "Không xu hướng"
+    if adx < ADX_STRONG:
+        return "Xu hướng yếu"
+    if adx < ADX_VERY_STRONG:
+        return "Xu hướng mạnh"
+    return "Xu hướng rất mạnh"
+
+
+def _trend(ind):
+    """Xu hướng ngắn/trung/dài hạn (mục I)"""
+    close, adx = ind["close"], ind["adx"]
+    adx_rising = adx is not None and ind["adx_prev"] is not None and adx > ind["adx_prev"]
+
+    if _above(close, ind["ma5"]) and _above(close, ind["ma10"]) and adx is not None and adx > ADX_STRONG \
+            and ind["volume_ratio"] > 100:
+        short = "Tăng mạnh"
+    elif (_below(close, ind["ma5"]) and _below(close, ind["ma10"])) or _below(close, ind["ma20"]):
+        short = "Yếu / đảo chiều giảm"
+    elif _above(close, ind["ma5"]) and _above(close, ind["ma10"]):
+        short = "Tăng"
+    else:
+        short = "Đi ngang"
+
+    if _above(close, ind["ma20"]) and _above(close, ind["ma50"]):
+        mid = "Tăng vừa" if adx is not None and ADX_NO_TREND <= adx <= ADX_STRONG and adx_rising else "Tăng"
+    elif _below(close, ind["ma20"]) and _below(close, ind["ma50"]):
+        mid = "Giảm"
+    elif ind["ma50"] is None:
+        mid = "N/A (cần >50 phiên)"
+    else:
+        mid = "Đi ngang"
+
+    if ind["ma200"] is None:
+        long = "N/A (cần >200 phiên)"
+    elif ind["ma50"] > ind["ma100"] > ind["ma200"] and close > ind["ma50"]:
+        long = "Uptrend"
+    elif close < ind["ma100"] and close < ind["ma200"]:
+        long = "Downtrend"
+    else:
+        long = "Đi ngang"
+
+    return {"short": short, "mid": mid, "long": long}
+
+
+def _volume(ind):
+    """Trạng thái giá - khối lượng theo bảng mục II"""
+    ratio, up = ind["volume_ratio"], ind["change"] > 0
+    if up and ratio > 100:
+        state = "Giá ↑ – Vol ↑: xu hướng tăng được xác nhận"
+    elif up:
+        state = "Giá ↑ – Vol ↓: tăng yếu, dễ đảo chiều"
+    elif ratio > VOLUME_HIGH:
+        state = "Giá ↓ – Vol ↑: phá vỡ hỗ trợ, bán mạnh"
+    elif ratio < 100:
+        state = "Giá ↓ – Vol ↓: tích lũy / tiết cung"
+    else:
+        state = "Giá ↓ – Vol trung bình: chưa rõ tín hiệu"
+    warning = "Vol > 200% TB: kiểm tra break thật hay bẫy" if ratio > VOLUME_SPIKE else None
+    return {"state": state, "warning": warning}
+
+
+def _levels(ind):
+    """
+    Hỗ trợ / kháng cự gần nhất (mục III) và Fibonacci 1 năm (mục VI)
+    Hỗ trợ luôn dưới giá, kháng cự luôn trên giá: vượt mọi mốc gần (break đỉnh 30 phiên) thì lấy
+    đỉnh 1 năm rồi Fibonacci mở rộng; thủng mọi mốc thì lấy đáy 1 năm; không còn mốc nào thì None
+    """
+    close = ind["close"]
+    span = ind["high_1y"] - ind["low_1y"]
+    candidates = [ind["ma20"], ind["ma50"], ind["ma100"], ind["ma200"], ind["low_30"], ind["high_30"]]
+    # Đỉnh/đáy 1 năm do chính phiên hôm nay tạo ra không phải là mốc cản
+    candidates += [ind["low_1y"] if ind["low_1y"] < ind["low"] else None,
+                   ind["high_1y"] if ind["high_1y"] > ind["high"] else None]
+    candidates += [ind["low_1y"] + span * level for level in FIBO_EXTENSIONS]
+    below = [v for v in candidates if v is not None and v < close]
+    above = [v for v in candidates if v is not None and v > close]
+    support = max(below) if below else None
+    resistance = min(above) if above else None
+
+    fibo = {f"{level * 100:.1f}%": ind["high_1y"] - span * level for level in FIBO_LEVELS}
+    return {"support": support, "resistance": resistance, "fibo": fibo}
+
+
+def _breakout(ind):
+    """Break thật / bulltrap qua đỉnh 30 phiên (mục IV)"""
+    if ind["close"] <= ind["high_30"]:
+        return None
+    if ind["volume_ratio"] >= VOLUME_HIGH and ind["close"] > ind["open"]:
+        return "Break thật (vol ≥150% TB, đóng cửa trên kháng cự)"
+    return "Nghi bulltrap (vượt đỉnh với vol thấp)"
+
+
+def _recommendation(ind, breakout):
+    """Khuyến nghị theo bảng Quy tắc tổng hợp (mục VIII), ưu tiên quy tắc rủi ro trước"""
+    close, adx = ind["close"], ind["adx"]
+    adx_falling = adx is not None and ind["adx_prev"] is not None and adx < ind["adx_prev"]
+    ratio = ind["volume_ratio"]
+
+    if (_below(close, ind["ma50"]) or _below(close, ind["ma100"])) and adx_falling:
+        return "GIẢM TỶ TRỌNG / CẮT LỖ", "Giá mất MA50/100, ADX giảm"
+    if _below(close, ind["ma20"]) and ratio > VOLUME_HIGH:
+        return "CẢNH BÁO GIẢM", "Giá < MA20, vol cao"
+    if ind["ma50"] is not None and ind["prev_close"] < (ind["ma50_prev"] or ind["ma50"]) \
+            and close > ind["ma50"] and ratio >= VOLUME_HIGH:
+        return "MUA BREAKOUT", "Giá break MA50 + vol mạnh"
+    if breakout and breakout.startswith("Break thật"):
+        return "MUA BREAKOUT", "Vượt kháng cự 30 phiên với vol ≥150% TB"
+    if _above(close, ind["ma5"]) and _above(close, ind["ma10"]) and adx is not None and adx > ADX_STRONG and ratio > 100:
+        return "MUA / TĂNG TỶ TRỌNG", "Giá > MA5/10, ADX > 30, vol ↑"
+    if _above(close, ind["ma20"]) and _below(close, ind["ma50"]):
+        return "MUA GOM NỀN", "Giá > MA20 nhưng < MA50"
+    return "QUAN SÁT", "Chưa thỏa điều kiện mua/bán rõ ràng"
+
+
+def _order_plan(ind, levels, recommendation):
+    """
+    Quản trị lệnh (mục VII): phân bổ T0/T2/T5, cắt lỗ 3-5% dưới hỗ trợ, R:R
+    Không có hỗ trợ dưới giá thì cắt lỗ 3-5% dưới giá hiện tại; không có kháng cự thì không đặt mục tiêu
+    """
+    support, resistance, close = levels["support"], levels["resistance"], ind["close"]
+    base = support if support is not None else close
+    stop_high = base * (1 - STOP_LOSS_RANGE[0])
+    stop_low = base * (1 - STOP_LOSS_RANGE[1])
+    risk = close - stop_high
+    reward = resistance - close if resistance is not None else None
+    reward_risk = (reward / risk) if reward is not None and risk > 0 else None
+    return {
+        "allocation": ALLOCATION if recommendation in BUY_RECOMMENDATIONS else [],
+        "stop_loss": (stop_low, stop_high),
+        "target": resistance,
+        "reward_risk": reward_risk,
+        "reward_risk_ok": reward_risk is not None and reward_risk >= MIN_REWARD_RISK,
+    }
+
+
+def evaluate(price_data):
+    """Chạy toàn bộ quy tắc Chim Cút trên dữ liệu giá; trả về dict kết quả (rỗng nếu không có dữ liệu)"""
+    ind = latest_indicators(price_data)
+    if not ind:
+        return {}
+
+    levels = _levels(ind)
+    breakout = _breakout(ind)
+    recommendation, reason = _recommendation(ind, breakout)
+
+    # Bảng đối chiếu số liệu thực tế với ngưỡng trong kiến thức
+    def _ma_row(window):
+        ma = ind[f"ma{window}"]
+        if ma is None:
+            return (f"Giá vs MA{window}", "N/A", "", "Thiếu dữ liệu")
+        return (f"Giá vs MA{window}", f"{ma:,.2f}", f"{ind['close'] / ma * 100 - 100:+.2f}%",
+                "TRÊN" if ind["close"] > ma else "DƯỚI")
+
+    checks = [_ma_row(w) for w in (5, 10, 20, 50, 100, 200)]
+    checks.append(("ADX(14)", f"{ind['adx']:.1f}" if ind["adx"] is not None else "N/A",
+                   "<20 / 20–30 / 30–50 / >50", adx_level(ind["adx"])))
+    checks.append(("KL / TB20", f"{ind['volume_ratio']:.0f}%", ">100% / >150% / >200%",
+                   "CAO" if ind["volume_ratio"] > VOLUME_HIGH else "THẤP" if ind["volume_ratio"] < 50 else "BÌNH THƯỜNG"))
+
+    return {
+        "indicators": ind,
+        "trend": _trend(ind),
+        "volume": _volume(ind),
+        "levels": levels,
+        "breakout": breakout,
+        "recommendation": recommendation,
+        "reason": reason,
+        "orders": _order_plan(ind, levels, recommendation),
+        "checks": checks,
+    }
+
+
+def _price(value, missing):
+    return f"{value:,.2f}" if value is not None else missing
+
+
+def format_report(symbol, result):
+    """Báo cáo Markdown theo cấu trúc I-VI của phân tích Chim Cút"""
+    if not result:
+        return f"❌ Không có dữ liệu giá để phân tích {symbol}"
+
+    ind, levels, orders = result["indicators"], result["levels"], result["orders"]
+    date = ind["date"].strftime('%Y-%m-%d') if hasattr(ind["date"], 'strftime') else ind["date"]
+    lines = [
+        f"### 🎯 PTKT Chim Cút {symbol} ({date})",
+        f"Giá đóng cửa **{ind['close']:,.2f}** ({ind['change']:+,.2f} / {ind['change_pct']:+.2f}%)",
+        "",
+        "**I. Tình hình xu hướng**",
+        f"- Ngắn hạn: {result['trend']['short']}",
+        f"- Trung hạn: {result['trend']['mid']}",
+        f"- Dài hạn: {result['trend']['long']}",
+        "",
+        "| Tiêu chí | Giá trị | So sánh | Đánh giá |",
+        "|---|---|---|---|",
+    ]
+    lines += [f"| {a} | {b} | {c} | {d} |" for a, b, c, d in result["checks"]]
+    lines += [
+        "",
+        "**II. Phân tích Volume & Momentum**",
+        f"- {result['volume']['state']}",
+        f"- ADX: {adx_level(ind['adx'])}",
+    ]
+    if result["volume"]["warning"]:
+        lines.append(f"- ⚠️ {result['volume']['warning']}")
+    if result["breakout"]:
+        lines.append(f"- Breakout: {result['breakout']}")
+    lines += [
+        "",
+        "**III. Vùng hỗ trợ & kháng cự**",
+        f"- Hỗ trợ gần nhất: {_price(levels['support'], 'chưa có (giá ở đáy 1 năm)')}",
+        f"- Kháng cự gần nhất: {_price(levels['resistance'], 'chưa có')}",
+        "- Fibonacci (1 năm): " + ", ".join(f"{k}: {v:,.2f}" for k, v in levels["fibo"].items()),
+        "",
+        "**IV. Khuyến nghị**",
+        f"- **{result['recommendation']}** — {result['reason']}",
+        "",
+        "**V. Quản trị lệnh**",
+    ]
+    if orders["allocation"]:
+        lines.append("- Phân bổ: " + ", ".join(f"{t}: {p}% vốn" for t, p in orders["allocation"]))
+    reference = "hỗ trợ" if levels["support"] is not None else "giá hiện tại"
+    lines.append(f"- Cắt lỗ: {orders['stop_loss'][0]:,.2f} – {orders['stop_loss'][1]:,.2f} (3–5% dưới {reference})")
+    lines.append(f"- Mục tiêu: {_price(orders['target'], 'chưa xác định')}")
+    if orders["reward_risk"] is not None:
+        verdict = "đạt" if orders["reward_risk_ok"] else "chưa đạt"
+        lines.append(f"- Risk:Reward ≈ 1:{orders['reward_risk']:.1f} ({verdict} tối thiểu 1:{MIN_REWARD_RISK})")
+    lines += [
+        "",
+        "**VI. Cảnh báo rủi ro**",
+        "- Kết quả tính tự động theo quy tắc Chim Cút. Đây chỉ là tham khảo, NĐT tự chịu trách nhiệm quyết định.",
+    ]
+    return "\n".join(lines)
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def narrative_payload(symbol, result):
+    """Dữ liệu gọn (JSON) gửi cho AI viết nhận định - không gửi lại toàn bộ kiến thức và lịch sử giá"""
+    ind = result["indicators"]
+    keys = ["close", "change_pct", "ma5", "ma10", "ma20", "ma50", "ma100", "ma200", "adx", "volume_ratio"]
+    payload = {
+        "symbol": symbol,
+        "indicators": {k: round(ind[k], 2) for k in keys if ind[k] is not None},
+        "trend": result["trend"],
+        "volume": result["volume"]["state"],
+        "breakout": result["breakout"],
+        "support": _round(result["levels"]["support"]),
+        "resistance": _round(result["levels"]["resistance"]),
+        "recommendation": result["recommendation"],
+        "reason": result["reason"],
+        "stop_loss": [round(v, 2) for v in result["orders"]["stop_loss"]],
+        "reward_risk": round(result["orders"]["reward_risk"], 2) if result["orders"]["reward_risk"] else None,
+    }
+    return json.dumps(payload, ensure_ascii=False)
+
+
+NARRATIVE_SYSTEM_PROMPT = """Bạn là chuyên gia phân tích kỹ thuật chứng khoán Việt Nam theo phương pháp Chim Cút.
+Bạn nhận kết quả ĐÃ TÍNH SẴN (JSON) từ bộ quy tắc. KHÔNG tính lại, KHÔNG đổi khuyến nghị.
+Viết nhận định ngắn gọn (tối đa 200 từ) bằng tiếng Việt: diễn giải xu hướng, khối lượng,
+vùng hỗ trợ/kháng cự và lý do khuyến nghị. Kết thúc bằng: "Đây chỉ là tham khảo, NĐT tự chịu trách nhiệm quyết định"."""
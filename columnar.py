@@ -0,0 +1,62 @@
+"""
+Lưu/đọc bảng dạng cột: mỗi cột là một file NumPy .npy, kèm schema.json
+Cột chuỗi được mã hóa thành số nguyên (codes) + danh sách giá trị trong schema
+Khi đọc dùng mmap_mode='r' để nhiều tiến trình dùng chung một bản trên đĩa (zero-copy)
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+SCHEMA_FILE = "schema.json"
+
+
+def save_table(directory, frame):
+    """Ghi DataFrame thành thư mục các file .npy theo cột"""
+    os.makedirs(directory, exist_ok=True)
+    schema = {"rows": len(frame), "columns": []}
+
+    for i, name in enumerate(frame.columns):
+        column = frame[name]
+        filename = f"col_{i}.npy"
+        entry = {"name": str(name), "file": filename}
+        if pd.api.types.is_numeric_dtype(column) or pd.api.types.is_datetime64_any_dtype(column):
+            np.save(os.path.join(directory, filename), np.ascontiguousarray(column.to_numpy()))
+        else:
+            # Mã hóa chuỗi: lưu codes int32, danh sách giá trị nằm trong schema
+            codes, categories = pd.factorize(column.astype(str), sort=True)
+            np.save(os.path.join(directory, filename), codes.astype(np.int32))
+            entry["categories"] = [str(c) for c in categories]
+        schema["columns"].append(entry)
+
+    with open(os.path.join(directory, SCHEMA_FILE), 'w', encoding='utf-8') as f:
+        json.dump(schema, f, ensure_ascii=False)
+
+
+def load_table(directory, mmap_mode='r'):
+    """
+    Đọc bảng đã lưu bằng save_table
+    Trả về (dict tên cột -> mảng memmap, dict tên cột -> danh sách giá trị của cột chuỗi)
+    """
+    with open(os.path.join(directory, SCHEMA_FILE), 'r', encoding='utf-8') as f:
+        schema = json.load(f)
+
+    columns, categories = {}, {}
+    for entry in schema["columns"]:
+        columns[entry["name"]] = np.load(os.path.join(directory, entry["file"]), mmap_mode=mmap_mode)
+        if "categories" in entry:
+            categories[entry["name"]] = entry["categories"]
+    return columns, categories
+
+
+def table_frame(columns, categories, rows=None):
+    """Dựng DataFrame từ bảng cột (có thể chỉ lấy một đoạn `rows`), giải mã cột chuỗi"""
+    data = {}
+    for name, values in columns.items():
+        values = values if rows is None else values[rows]
+        if name in categories:
+            data[name] = pd.Categorical.from_codes(np.asarray(values), categories=categories[name])
+        else:
+            data[name] = np.asarray(values)
+    return pd.DataFrame(data)
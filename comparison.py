@@ -0,0 +1,149 @@
+"""
+Tính toán so sánh nhiều cổ phiếu: tương quan, beta và sức mạnh tương đối (RS)
+Toàn bộ tính bằng ma trận NumPy (ngày x mã) để xử lý hàng trăm mã trong một lần
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def log_returns(closes):
+    """Lợi suất log theo ngày của ma trận giá (ngày x mã)"""
+    values = closes.to_numpy(dtype=float)
+    returns = np.full_like(values, np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns[1:] = np.log(values[1:] / values[:-1])
+    return pd.DataFrame(returns, index=closes.index, columns=closes.columns)
+
+
+def _rolling_sum(values, window):
+    """Tổng trượt theo cột bằng cumsum (O(T x N), không lặp theo cửa sổ)"""
+    cumsum = np.cumsum(values, axis=0)
+    out = np.full_like(cumsum, np.nan)
+    if len(values) >= window:
+        out[window - 1] = cumsum[window - 1]
+        out[window:] = cumsum[window:] - cumsum[:-window]
+    return out
+
+
+def _rolling_moments(returns, benchmark, window):
+    """Các tổng trượt cần cho tương quan/beta giữa từng mã và chỉ số chuẩn"""
+    x = np.asarray(returns, dtype=float)
+    y = np.asarray(benchmark, dtype=float)[:, None]
+    mask = ~np.isnan(x) & ~np.isnan(y)
+    x0 = np.where(mask, x, 0.0)
+    y0 = np.where(mask, y, 0.0)
+
+    n = _rolling_sum(mask.astype(float), window)
+    sx = _rolling_sum(x0, window)
+    sy = _rolling_sum(y0, window)
+    sxy = _rolling_sum(x0 * y0, window)
+    sxx = _rolling_sum(x0 * x0, window)
+    syy = _rolling_sum(y0 * y0, window)
+
+    cov = n * sxy - sx * sy
+    var_x = n * sxx - sx * sx
+    var_y = n * syy - sy * sy
+    # Chỉ nhận cửa sổ đủ dữ liệu, tránh mã mới niêm yết cho kết quả sai lệch
+    full = n == window
+    return cov, var_x, var_y, full
+
+
+def rolling_correlation(returns, benchmark, window=60):
+    """Tương quan trượt của từng mã so với chỉ số chuẩn (ngày x mã)"""
+    cov, var_x, var_y, full = _rolling_moments(returns.to_numpy(), benchmark.to_numpy(), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cov / np.sqrt(var_x * var_y)
+    corr = np.where(full, corr, np.nan)
+    return pd.DataFrame(corr, index=returns.index, columns=returns.columns)
+
+
+def rolling_beta(returns, benchmark, window=60):
+    """Beta trượt của từng mã so với chỉ số chuẩn (ngày x mã)"""
+    cov, _, var_y, full = _rolling_moments(returns.to_numpy(), benchmark.to_numpy(), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = cov / var_y
+    beta = np.where(full, beta, np.nan)
+    return pd.DataFrame(beta, index=returns.index, columns=returns.columns)
+
+
+def correlation_matrix(returns, window=60):
+    """
+    Ma trận tương quan mã x mã trên `window` phiên gần nhất
+    Chuẩn hóa rồi nhân ma trận Z.T @ Z (dùng BLAS) thay vì tính từng cặp
+    """
+    values = returns.to_numpy(dtype=float)[-window:]
+    symbols = returns.columns
+    # Mã thiếu dữ liệu trong cửa sổ không được tính (để NaN)
+    valid = ~np.isnan(values).any(axis=0)
+    result = np.full((len(symbols), len(symbols)), np.nan)
+
+    block = values[:, valid]
+    if block.shape[0] > 1 and block.shape[1] > 0:
+        centered = block - block.mean(axis=0)
+        std = centered.std(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z = centered / std
+        corr = (z.T @ z) / block.shape[0]
+        result[np.ix_(valid, valid)] = corr
+
+    return pd.DataFrame(result, index=symbols, columns=symbols)
+
+
+def relative_strength(closes, benchmark_close):
+    """Đường sức mạnh tương đối: (giá / giá đầu kỳ) / (chỉ số / chỉ số đầu kỳ)"""
+    values = closes.to_numpy(dtype=float)
+    bench = benchmark_close.to_numpy(dtype=float)
+    # Giá đầu kỳ = phiên có dữ liệu đầu tiên của từng mã
+    first_valid = np.argmax(~np.isnan(values), axis=0)
+    base = values[first_valid, np.arange(values.shape[1])]
+    bench_base = bench[first_valid]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = (values / base) / (bench[:, None] / bench_base)
+    return pd.DataFrame(rs, index=closes.index, columns=closes.columns)
+
+
+def performance(closes, periods=(20, 60, 120)):
+    """Tỷ suất sinh lời (%) qua các kỳ (số phiên) tính đến phiên gần nhất"""
+    values = closes.ffill().to_numpy(dtype=float)
+    result = {}
+    for period in periods:
+        if len(values) > period:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                result[f"{period}P (%)"] = (values[-1] / values[-1 - period] - 1) * 100
+        else:
+            result[f"{period}P (%)"] = np.full(values.shape[1], np.nan)
+    return pd.DataFrame(result, index=closes.columns)
+
+
+def compute_comparison(closes, index_close, window=60, periods=(20, 60, 120)):
+    """
+    Tính toàn bộ chỉ số so sánh cho cả danh sách theo dõi
+    closes: ma trận giá đóng cửa (ngày x mã); index_close: giá đóng cửa chỉ số chuẩn
+    """
+    # Căn theo ngày giao dịch của chỉ số
+    closes = closes.reindex(index_close.index)
+    returns = log_returns(closes)
+    index_returns = log_returns(index_close.to_frame()).iloc[:, 0]
+
+    rolling_corr = rolling_correlation(returns, index_returns, window)
+    betas = rolling_beta(returns, index_returns, window)
+    rs_line = relative_strength(closes, index_close)
+
+    index_perf = performance(index_close.to_frame(), periods).iloc[0]
+    summary = performance(closes, periods)
+    summary.insert(0, "Giá", closes.ffill().iloc[-1])
+    for column in index_perf.index:
+        summary[f"RS {column.split(' ')[0]}"] = summary[column] - index_perf[column]
+    summary[f"Tương quan VNINDEX ({window}P)"] = rolling_corr.ffill().iloc[-1]
+    summary[f"Beta ({window}P)"] = betas.ffill().iloc[-1]
+
+    return {
+        "closes": closes,
+        "returns": returns,
+        "correlation": correlation_matrix(returns, window),
+        "rolling_correlation": rolling_corr,
+        "rolling_beta": betas,
+        "relative_strength": rs_line,
+        "summary": summary,
+    }
@@ -0,0 +1,98 @@
+"""
+Chỉ báo kỹ thuật dùng chung (MA, ADX, khối lượng)
+Các hàm nhận Series (một mã) hoặc DataFrame ngày x mã (nhiều mã) như nhau
+"""
+
+import numpy as np
+import pandas as pd
+
+MA_WINDOWS = [5, 10, 20, 50, 100, 200]
+ADX_PERIOD = 14
+VOLUME_WINDOW = 20
+
+
+def moving_average(close, window):
+    """Đường trung bình giá (SMA)"""
+    return close.rolling(window=window).mean()
+
+
+def calculate_adx(high, low, close, period=ADX_PERIOD):
+    """
+    ADX đo lường sức mạnh xu hướng (0-100)
+    Dùng trung bình trượt đơn giản cho TR, +DM, -DM và DX
+    """
+    # Tính True Range (fmax bỏ qua NaN ở phiên đầu tiên: TR = high - low)
+    high_low = high - low
+    high_close = (high - close.shift(1)).abs()
+    low_close = (low - close.shift(1)).abs()
+    tr = np.fmax(high_low, np.fmax(high_close, low_close))
+
+    # Tính +DM và -DM
+    high_diff = high.diff()
+    low_diff = -low.diff()
+    plus_dm = high_diff.where((high_diff > low_diff) & (high_diff > 0), 0)
+    minus_dm = low_diff.where((low_diff > high_diff) & (low_diff > 0), 0)
+
+    # Smooth
+    atr = tr.rolling(window=period).mean()
+    plus_di = 100 * (plus_dm.rolling(window=period).mean() / atr)
+    minus_di = 100 * (minus_dm.rolling(window=period).mean() / atr)
+
+    # ADX
+    dx = 100 * (plus_di - minus_di).abs() / (plus_di + minus_di)
+    return dx.rolling(window=period).mean()
+
+
+def _value(series):
+    """Giá trị cuối của Series, None nếu thiếu dữ liệu"""
+    if series is None or series.empty:
+        return None
+    value = series.iloc[-1]
+    return None if pd.isna(value) else float(value)
+
+
+def latest_indicators(price_data):
+    """Bộ chỉ báo tại phiên gần nhất của một mã (dict; chỉ báo thiếu dữ liệu = None)"""
+    if price_data is None or price_data.empty:
+        return {}
+
+    close, volume = price_data['close'], price_data['volume']
+    latest = price_data.iloc[-1]
+    prev_close = float(close.iloc[-2]) if len(close) > 1 else float(latest['close'])
+    change = float(latest['close']) - prev_close
+
+    result = {
+        "date": latest['time'] if 'time' in price_data.columns else latest.name,
+        "open": float(latest['open']),
+        "high": float(latest['high']),
+        "low": float(latest['low']),
+        "close": float(latest['close']),
+        "volume": float(latest['volume']),
+        "prev_close": prev_close,
+        "change": change,
+        "change_pct": (change / prev_close * 100) if prev_close else 0.0,
+    }
+    for window in MA_WINDOWS:
+        ma = moving_average(close, window)
+        result[f"ma{window}"] = _value(ma)
+        result[f"ma{window}_prev"] = _value(ma.iloc[:-1])
+
+    avg_volume = _value(moving_average(volume, VOLUME_WINDOW))
+    result["avg_volume_20"] = avg_volume
+    result["volume_ratio"] = (result["volume"] / avg_volume * 100) if avg_volume else 0.0
+
+    if len(price_data) > ADX_PERIOD:
+        adx = calculate_adx(price_data['high'], price_data['low'], close, ADX_PERIOD)
+        result["adx"] = _value(adx)
+        result["adx_prev"] = _value(adx.iloc[:-1])
+    else:
+        result["adx"] = result["adx_prev"] = None
+
+    # Đỉnh/đáy 30 phiên (không tính phiên hiện tại) để xét breakout
+    recent = price_data.tail(31).iloc[:-1] if len(price_data) > 1 else price_data
+    result["high_30"] = float(recent['high'].max())
+    result["low_30"] = float(recent['low'].min())
+    year = price_data.tail(250)
+    result["high_1y"] = float(year['high'].max())
+    result["low_1y"] = float(year['low'].min())
+    return result
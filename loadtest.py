@@ -0,0 +1,374 @@
+"""
+Kiểm tra tải: giả lập N phiên người dùng chạy đồng thời app.py
+Chạy hoàn toàn offline: vnstock được thay bằng bộ dữ liệu giả, OpenAI trỏ tới server giả cục bộ
+Chạy: python loadtest.py --sessions 20 --iterations 5 --data-latency 200 --llm-latency 1500
+
+Mỗi phiên (Streamlit AppTest) lặp lại các thao tác:
+    - Tra cứu mã (submit form tìm kiếm)
+    - Chuyển tab (tab chạy phía trình duyệt, mỗi tương tác widget = một lần rerun script)
+    - Gửi tin nhắn chat cho AI
+AppTest dùng chung Runtime/config toàn cục nên không chạy được nhiều phiên trong một tiến trình:
+mỗi phiên chạy trong một tiến trình riêng, các phiên chờ nhau (barrier) rồi bắt đầu cùng lúc.
+Cache trong RAM (st.cache_data, danh bạ mã...) vì vậy không dùng chung giữa các phiên,
+kết quả là chi phí mỗi phiên khi cùng tranh CPU, chưa tính lợi ích cache dùng chung.
+Phiên thất bại khi script lỗi, app hiện st.error hoặc luồng script ghi log lỗi.
+Báo cáo: throughput (rerun/giây), độ trễ rerun p50/p95 theo thao tác,
+RAM tăng thêm của từng phiên (đo trong tiến trình của phiên, sau khi đã nạp app)
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import types
+import random
+import logging
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_SYMBOLS = ["VNM", "VCB", "FPT", "HPG", "VHM", "VIC", "MWG", "VRE", "GAS", "MSN", "TCB", "VPB", "POW", "SSI"]
+CHAT_MESSAGES = [
+    "Phân tích kỹ thuật mã này",
+    "Có nên mua ở giá hiện tại không?",
+    "Rủi ro đầu tư là gì?",
+]
+
+
+# ==================== VNSTOCK GIẢ ====================
+
+def _rng(*parts):
+    """Bộ sinh số ngẫu nhiên cố định theo mã -> dữ liệu giả lặp lại được"""
+    return np.random.default_rng(zlib.crc32("|".join(str(p) for p in parts).encode()))
+
+
+def _fake_history(symbol, start, end):
+    """Giá OHLCV giả (bước ngẫu nhiên), cùng định dạng với stock.quote.history"""
+    dates = pd.bdate_range(start, end)
+    rng = _rng(symbol)
+    close = 20000 * np.exp(np.cumsum(rng.normal(0, 0.02, len(dates))))
+    spread = np.abs(rng.normal(0, 0.01, len(dates))) * close
+    return pd.DataFrame({
+        "time": dates,
+        "open": close + rng.normal(0, 0.005, len(dates)) * close,
+        "high": close + spread,
+        "low": close - spread,
+        "close": close,
+        "volume": rng.integers(100_000, 5_000_000, len(dates)).astype(float),
+    })
+
+
+def _fake_statement(symbol, report, quarters=12):
+    """Báo cáo tài chính giả theo quý (định dạng lang='vi')"""
+    rng = _rng(symbol, report)
+    periods = [(2024 - i // 4, 4 - i % 4) for i in range(quarters)]
+    data = {"CP": [symbol] * quarters, "Năm": [p[0] for p in periods], "Kỳ": [p[1] for p in periods]}
+    for item in ["Doanh thu", "Lợi nhuận sau thuế", "Tổng tài sản", "Vốn chủ sở hữu"]:
+        data[item] = rng.uniform(1e11, 1e13, quarters)
+    return pd.DataFrame(data)
+
+
+def make_fake_vnstock(latency=0.0, symbols=None):
+    """
+    Tạo module `vnstock` giả; mỗi lời gọi dữ liệu chờ `latency` giây
+    `symbols`: danh sách mã niêm yết trả về từ listing (mặc định DEFAULT_SYMBOLS)
+    """
+    listed = list(symbols or DEFAULT_SYMBOLS)
+
+    def _wait():
+        if latency:
+            time.sleep(latency)
+
+    class _Quote:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def history(self, start, end, interval='1D'):
+            _wait()
+            return _fake_history(self.symbol, start, end)
+
+    class _Company:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def overview(self):
+            _wait()
+            return pd.DataFrame([{"symbol": self.symbol, "industry": "Giả lập", "no_employees": 1000}])
+
+    class _Finance:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def _report(self, name):
+            _wait()
+            return _fake_statement(self.symbol, name)
+
+        def balance_sheet(self, period='quarter', lang='vi'):
+            return self._report("balance_sheet")
+
+        def income_statement(self, period='quarter', lang='vi'):
+            return self._report("income_statement")
+
+        def ratio(self, period='quarter', lang='vi'):
+            return self._report("ratio")
+
+    class _Listing:
+        def all_symbols(self):
+            _wait()
+            return pd.DataFrame({"symbol": listed, "organ_name": [f"Công ty {s}" for s in listed]})
+
+    class _Stock:
+        def __init__(self, symbol, source):
+            self.quote = _Quote(symbol)
+            self.company = _Company(symbol)
+            self.finance = _Finance(symbol)
+            self.listing = _Listing()
+
+    class Vnstock:
+        def stock(self, symbol='VNM', source='TCBS'):
+            return _Stock(symbol, source)
+
+    module = types.ModuleType("vnstock")
+    module.Vnstock = Vnstock
+    return module
+
+
+# ==================== OPENAI GIẢ ====================
+
+def start_fake_openai(latency=0.0):
+    """Chạy server giả API chat.completions ở localhost, trả về (server, base_url)"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            request = json.loads(body or b"{}")
+            if latency:
+                time.sleep(latency)
+            prompt_chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+            payload = json.dumps({
+                "id": "chatcmpl-loadtest",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "gpt-4o-mini"),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": "Phản hồi giả lập từ server kiểm tra tải."},
+                }],
+                "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": 10, "total_tokens": prompt_chars // 4 + 10},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# ==================== ĐO ĐẠC ====================
+
+# Barrier dùng chung giữa các tiến trình phiên (gán trong _init_worker)
+_barrier = None
+
+def resident_memory():
+    """RSS hiện tại của tiến trình (byte)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    import resource
+    # ru_maxrss: KB trên Linux, byte trên macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def percentile(values, q):
+    """Phân vị q (0-100); 0 nếu không có mẫu"""
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _find(widgets, label):
+    """Tìm widget theo nhãn"""
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"Không tìm thấy widget '{label}'")
+
+
+class _ErrorLog(logging.Handler):
+    """Ghi lại log lỗi của Streamlit (lỗi trong luồng script không hiện ra ở AppTest)"""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage().splitlines()[0] if record.getMessage() else record.name)
+
+
+def _capture_errors():
+    """Gắn _ErrorLog vào mọi logger của Streamlit (kể cả logger tạo sau) và lỗi chưa bắt trong thread"""
+    import streamlit.logger as st_logger
+
+    errors = _ErrorLog()
+    for logger in list(st_logger._loggers.values()):
+        logger.addHandler(errors)
+    # get_logger gọi setup_formatter cho mỗi logger mới (tra theo tên module lúc gọi)
+    setup_formatter = st_logger.setup_formatter
+
+    def _setup_formatter(logger):
+        setup_formatter(logger)
+        logger.addHandler(errors)
+
+    st_logger.setup_formatter = _setup_formatter
+    threading.excepthook = lambda args: errors.messages.append(f"{args.exc_type.__name__}: {args.exc_value}")
+    return errors
+
+
+def _timed(timings, action, at, timeout, errors):
+    """Chạy một lần rerun, ghi lại thời gian; lỗi script, st.error hay log lỗi đều là thất bại"""
+    started = time.perf_counter()
+    at.run(timeout=timeout)
+    timings.append((action, time.perf_counter() - started))
+    if at.exception:
+        raise RuntimeError(f"{action}: {at.exception[0].message}")
+    if at.error:
+        raise RuntimeError(f"{action}: {at.error[0].value}")
+    if errors.messages:
+        raise RuntimeError(f"{action}: lỗi trong luồng script: {errors.messages[0]}")
+
+
+def _init_worker(app_dir, data_latency, symbols, barrier):
+    """Khởi tạo tiến trình của một phiên: vnstock giả (niêm yết đúng các mã tra cứu), đường dẫn import của app"""
+    global _barrier
+    sys.path.insert(0, app_dir)
+    sys.modules["vnstock"] = make_fake_vnstock(data_latency, symbols)
+    _barrier = barrier
+
+
+def run_session(session_id, app_path, iterations, symbols, timeout):
+    """
+    Một phiên người dùng giả lập (chạy trong tiến trình riêng)
+    Trả về dict: timings [(thao tác, thời gian)], mốc bắt đầu/kết thúc, RAM trước/sau, lỗi (nếu có)
+    """
+    from streamlit.testing.v1 import AppTest
+
+    errors = _capture_errors()
+    # Nạp app một lần trước khi đo (import thư viện, module của app) rồi chờ các phiên khác
+    AppTest.from_file(app_path, default_timeout=timeout).run(timeout=timeout)
+    _barrier.wait(timeout=timeout)
+
+    rng = random.Random(session_id)
+    result = {"timings": [], "error": None, "rss_before": resident_memory(), "started": time.time()}
+    try:
+        at = AppTest.from_file(app_path, default_timeout=timeout)
+        at.session_state["openai_api_key"] = "sk-loadtest"
+        _timed(result["timings"], "khởi tạo", at, timeout, errors)
+
+        for _ in range(iterations):
+            _find(at.text_input, "Nhập mã chứng khoán").set_value(rng.choice(symbols))
+            _find(at.button, "🔍 Tra cứu").click()
+            _timed(result["timings"], "tra cứu", at, timeout, errors)
+
+            _timed(result["timings"], "chuyển tab", at, timeout, errors)
+
+            at.chat_input[0].set_value(rng.choice(CHAT_MESSAGES))
+            _timed(result["timings"], "chat", at, timeout, errors)
+    except Exception as e:
+        result["error"] = f"Phiên {session_id}: {e}"
+    result["finished"] = time.time()
+    result["rss_after"] = resident_memory()
+    return result
+
+
+def main():
+    """Chạy kiểm tra tải và in báo cáo"""
+    parser = argparse.ArgumentParser(description="Kiểm tra tải app.py với nhiều phiên đồng thời (offline)")
+    parser.add_argument("--app", default="app.py", help="File Streamlit cần kiểm tra")
+    parser.add_argument("--sessions", type=int, default=10, help="Số phiên đồng thời")
+    parser.add_argument("--iterations", type=int, default=3, help="Số vòng thao tác mỗi phiên")
+    parser.add_argument("--data-latency", type=float, default=100, help="Độ trễ mỗi lời gọi vnstock giả (ms)")
+    parser.add_argument("--llm-latency", type=float, default=1000, help="Độ trễ mỗi lời gọi OpenAI giả (ms)")
+    parser.add_argument("--symbols", default=",".join(DEFAULT_SYMBOLS), help="Danh sách mã dùng để tra cứu")
+    parser.add_argument("--timeout", type=float, default=120, help="Thời gian tối đa mỗi lần rerun (giây)")
+    args = parser.parse_args()
+
+    # Cô lập khỏi dữ liệu thật: vnstock giả (trong từng tiến trình phiên), OpenAI giả, thư mục làm việc tạm
+    # Tiến trình con kế thừa biến môi trường và thư mục làm việc
+    app_path = os.path.abspath(args.app)
+    server, base_url = start_fake_openai(args.llm_latency / 1000)
+    os.environ["OPENAI_BASE_URL"] = base_url
+    workdir = tempfile.mkdtemp(prefix="trolystock-loadtest-")
+    os.environ["TROLYSTOCK_SNAPSHOT_DIR"] = os.path.join(workdir, "snapshots")
+    os.environ["TROLYSTOCK_CACHE_DIR"] = os.path.join(workdir, "cache")
+    os.chdir(workdir)
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    print(f"Chạy {args.sessions} phiên x {args.iterations} vòng, mỗi phiên một tiến trình "
+          f"(vnstock {args.data_latency:.0f}ms, OpenAI {args.llm_latency:.0f}ms)...")
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(args.sessions)
+    results, failures = [], []
+    with ProcessPoolExecutor(max_workers=args.sessions, mp_context=context, initializer=_init_worker,
+                             initargs=(os.path.dirname(app_path), args.data_latency / 1000, symbols, barrier)) as executor:
+        futures = [
+            executor.submit(run_session, i, app_path, args.iterations, symbols, args.timeout)
+            for i in range(args.sessions)
+        ]
+        for i, future in enumerate(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append(f"Phiên {i}: {e}")
+                continue
+            results.append(result)
+            if result["error"]:
+                failures.append(result["error"])
+    server.shutdown()
+
+    timings = [t for result in results for t in result["timings"]]
+    elapsed = (max(r["finished"] for r in results) - min(r["started"] for r in results)) if results else 0
+    completed = [r for r in results if not r["error"]]
+
+    # Báo cáo
+    print("\n" + "=" * 60)
+    print("KẾT QUẢ KIỂM TRA TẢI")
+    print("=" * 60)
+    print(f"Phiên hoàn thành: {len(completed)}/{args.sessions}")
+    print(f"Tổng số rerun: {len(timings)} trong {elapsed:.2f}s")
+    print(f"Throughput: {len(timings) / elapsed:.2f} rerun/giây" if elapsed else "Throughput: N/A")
+    all_latencies = [t for _, t in timings]
+    print(f"Độ trễ rerun: p50 {percentile(all_latencies, 50) * 1000:.0f}ms, "
+          f"p95 {percentile(all_latencies, 95) * 1000:.0f}ms")
+    for action in dict.fromkeys(a for a, _ in timings):
+        values = [t for a, t in timings if a == action]
+        print(f"  - {action:<10} n={len(values):<4} p50 {percentile(values, 50) * 1000:>7.0f}ms  "
+              f"p95 {percentile(values, 95) * 1000:>7.0f}ms")
+    if completed:
+        growth = [(r["rss_after"] - r["rss_before"]) / 2**20 for r in completed]
+        total = [r["rss_after"] / 2**20 for r in completed]
+        print(f"RAM tăng thêm mỗi phiên: TB {np.mean(growth):.1f}MB, tối đa {max(growth):.1f}MB "
+              f"(RSS tiến trình phiên: TB {np.mean(total):.1f}MB, gồm cả thư viện đã nạp)")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
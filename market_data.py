@@ -0,0 +1,215 @@
+"""
+Lấy dữ liệu thị trường từ vnstock
+Các trang của app dùng chung module này để tải giá và ghép dữ liệu nhiều mã
+"""
+
+import re
+import threading
+from collections import OrderedDict
+import pandas as pd
+from vnstock import Vnstock
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from snapshot import load_snapshot
+from transport import MODE as TRANSPORT_MODE, call
+
+# Mã chỉ số dùng làm chuẩn so sánh (beta, sức mạnh tương đối)
+INDEX_SYMBOL = "VNINDEX"
+
+# Các loại báo cáo tài chính lấy từ stock.finance
+STATEMENT_REPORTS = ["balance_sheet", "income_statement", "ratio"]
+
+# Tên cột năm/quý trong báo cáo tài chính của vnstock (lang='vi' và 'en')
+YEAR_COLUMNS = ["Năm", "yearReport", "year"]
+QUARTER_COLUMNS = ["Kỳ", "lengthReport", "quarter"]
+
+# Giá từng mã giữ trong RAM trong ngày giao dịch: (mã, nguồn, số ngày) -> DataFrame
+# Giữ tối đa HISTORY_CACHE_SIZE mã (bỏ mã lâu không dùng); mã đọc được từ snapshot không giữ lại
+HISTORY_CACHE_SIZE = 600
+_history_cache = OrderedDict()
+_history_cache_day = None
+_history_lock = threading.Lock()
+
+
+def trading_day(now=None):
+    """Ngày giao dịch gần nhất (bỏ qua thứ 7, chủ nhật) - dùng làm khóa cache theo ngày"""
+    day = (now or datetime.now()).date()
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day.strftime('%Y-%m-%d')
+
+
+def current_snapshot():
+    """
+    Snapshot dùng thay lời gọi vnstock; None khi đang ghi/phát lại
+    (để bản ghi có đủ mọi lời gọi và phát lại không phụ thuộc thư mục snapshots/)
+    """
+    return load_snapshot() if TRANSPORT_MODE == "live" else None
+
+
+def fetch_price_history(symbol, source="TCBS", days=1000, end_date=None, use_snapshot=True):
+    """
+    Lấy dữ liệu giá OHLCV theo ngày của một mã
+    Nếu có snapshot của ngày giao dịch hiện tại, cùng nguồn, đủ lịch sử và chứa mã này
+    thì đọc từ snapshot (không gọi mạng)
+    """
+    end_date = end_date or datetime.now()
+    start_date = end_date - timedelta(days=days)
+    if use_snapshot:
+        snapshot = current_snapshot()
+        if (snapshot is not None and snapshot.date >= trading_day(end_date) and symbol in snapshot
+                and snapshot.serves(source, start_date)):
+            return snapshot.history(symbol, start=start_date, end=end_date)
+
+    def _fetch():
+        stock = Vnstock().stock(symbol=symbol, source=source)
+        return stock.quote.history(
+            start=start_date.strftime('%Y-%m-%d'),
+            end=end_date.strftime('%Y-%m-%d'),
+            interval='1D'
+        )
+
+    # Khóa ghi/phát lại không gồm ngày kết thúc để bản ghi dùng lại được ở các ngày sau
+    return call("history", {"symbol": symbol, "source": source, "days": days}, _fetch)
+
+
+def fetch_company_overview(symbol, source="TCBS"):
+    """Lấy thông tin tổng quan công ty"""
+    return call("company_overview", {"symbol": symbol, "source": source},
+                lambda: Vnstock().stock(symbol=symbol, source=source).company.overview())
+
+
+def fetch_all_symbols(source="VCI"):
+    """Danh sách toàn bộ mã niêm yết (listing.all_symbols)"""
+    return call("all_symbols", {"source": source},
+                lambda: Vnstock().stock(symbol='VNM', source=source).listing.all_symbols())
+
+
+def fetch_statement(symbol, report, source="TCBS"):
+    """Lấy một báo cáo tài chính theo quý (report: balance_sheet, income_statement, ratio)"""
+    def _fetch():
+        stock = Vnstock().stock(symbol=symbol, source=source)
+        return getattr(stock.finance, report)(period='quarter', lang='vi')
+
+    return call("statement", {"symbol": symbol, "report": report, "source": source}, _fetch)
+
+
+def normalize_statement(data, symbol, report):
+    """
+    Chuyển báo cáo tài chính dạng rộng (mỗi chỉ tiêu một cột) sang dạng dài:
+    symbol, report, year, quarter, item, value - mỗi dòng một chỉ tiêu của một quý
+    """
+    columns = ["symbol", "report", "year", "quarter", "item", "value"]
+    if data is None or data.empty:
+        return pd.DataFrame(columns=columns)
+
+    data = data.copy()
+    # Bảng chỉ số (ratio) có cột 2 tầng: giữ tên chỉ tiêu ở tầng cuối
+    if isinstance(data.columns, pd.MultiIndex):
+        data.columns = [c[-1] for c in data.columns]
+    data = data.loc[:, ~pd.Index(data.columns).duplicated()]
+
+    year_col = next((c for c in YEAR_COLUMNS if c in data.columns), None)
+    quarter_col = next((c for c in QUARTER_COLUMNS if c in data.columns), None)
+    if year_col and quarter_col:
+        years = pd.to_numeric(data[year_col], errors='coerce')
+        quarters = pd.to_numeric(data[quarter_col], errors='coerce')
+    else:
+        # Một số nguồn để kỳ báo cáo ở index, dạng "2024-Q2"
+        parsed = [re.search(r"(\d{4})\D*Q?(\d)", str(i)) for i in data.index]
+        years = pd.Series([int(m.group(1)) if m else None for m in parsed], index=data.index, dtype=float)
+        quarters = pd.Series([int(m.group(2)) if m else None for m in parsed], index=data.index, dtype=float)
+
+    items = data.drop(columns=[c for c in (year_col, quarter_col) if c]).apply(pd.to_numeric, errors='coerce')
+    items = items.loc[:, items.notna().any()]
+    items["year"] = years.to_numpy()
+    items["quarter"] = quarters.to_numpy()
+    items = items.dropna(subset=["year", "quarter"])
+
+    long = items.melt(id_vars=["year", "quarter"], var_name="item", value_name="value").dropna(subset=["value"])
+    long["symbol"] = symbol
+    long["report"] = report
+    long["year"] = long["year"].astype(int)
+    long["quarter"] = long["quarter"].astype(int)
+    long["item"] = long["item"].astype(str)
+    return long[columns].reset_index(drop=True)
+
+
+def fetch_price_histories(symbols, source="TCBS", days=1000, max_workers=8, use_snapshot=True):
+    """
+    Tải song song giá của nhiều mã
+    Trả về (dict mã -> DataFrame, dict mã -> lỗi); mã lỗi không làm hỏng cả lô
+    """
+    histories, errors = {}, {}
+
+    def _fetch(symbol):
+        try:
+            return symbol, fetch_price_history(symbol, source=source, days=days, use_snapshot=use_snapshot), None
+        except Exception as e:
+            return symbol, None, str(e)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for symbol, data, error in executor.map(_fetch, symbols):
+            if error is None and data is not None and not data.empty:
+                histories[symbol] = data
+            else:
+                errors[symbol] = error or "Không có dữ liệu"
+    return histories, errors
+
+
+def cached_price_histories(symbols, source="TCBS", days=1000, max_workers=8):
+    """
+    Như fetch_price_histories nhưng giữ giá từng mã trong RAM tới hết ngày giao dịch:
+    đổi danh sách mã chỉ tải thêm các mã chưa có; mã lỗi không được giữ (lần sau tải lại)
+    Mã có trong snapshot dùng được thì đọc thẳng từ snapshot mỗi lần (không chép vào RAM của worker)
+    DataFrame trả về dùng chung giữa các phiên, không sửa trực tiếp
+    """
+    global _history_cache_day
+    today = trading_day()
+    snapshot = current_snapshot()
+    if (snapshot is None or snapshot.date < today
+            or not snapshot.serves(source, datetime.now() - timedelta(days=days))):
+        snapshot = None
+
+    with _history_lock:
+        if _history_cache_day != today:
+            _history_cache.clear()
+            _history_cache_day = today
+        histories = {}
+        for s in symbols:
+            if (s, source, days) in _history_cache:
+                _history_cache.move_to_end((s, source, days))
+                histories[s] = _history_cache[(s, source, days)]
+
+    errors = {}
+    missing = [s for s in symbols if s not in histories]
+    if missing:
+        fetched, errors = fetch_price_histories(missing, source=source, days=days, max_workers=max_workers)
+        with _history_lock:
+            if _history_cache_day == today:
+                for s, data in fetched.items():
+                    if snapshot is None or s not in snapshot:
+                        _history_cache[(s, source, days)] = data
+                while len(_history_cache) > HISTORY_CACHE_SIZE:
+                    _history_cache.popitem(last=False)
+        histories.update(fetched)
+    return {s: histories[s] for s in symbols if s in histories}, errors
+
+
+def with_date_index(price_data):
+    """Đưa cột 'time' của vnstock thành DatetimeIndex (nếu có)"""
+    if 'time' in price_data.columns:
+        price_data = price_data.set_index(pd.to_datetime(price_data['time'])).drop(columns=['time'])
+    return price_data
+
+
+def build_field_matrix(histories, field='close'):
+    """Ghép một cột (mặc định giá đóng cửa) của nhiều mã thành ma trận ngày x mã, căn theo ngày"""
+    columns = {}
+    for symbol, data in histories.items():
+        series = with_date_index(data)[field]
+        # Bỏ ngày trùng (nếu nguồn trả về trùng phiên)
+        columns[symbol] = series[~series.index.duplicated(keep='last')]
+    if not columns:
+        return pd.DataFrame()
+    return pd.DataFrame(columns).sort_index()
@@ -0,0 +1,246 @@
+"""
+Trang so sánh cổ phiếu: tương quan, beta so với VN-Index và sức mạnh tương đối
+Giá từng mã được giữ trong RAM theo ngày giao dịch (market_data.cached_price_histories):
+đổi cửa sổ hay thêm/bớt mã chỉ tính lại bằng NumPy, chỉ tải các mã chưa có.
+Đổi lựa chọn mã chỉ cắt lại kết quả đã có nên biểu đồ hiện ngay
+"""
+
+import streamlit as st
+import plotly.graph_objects as go
+import json
+import os
+from openai import OpenAI
+from market_data import INDEX_SYMBOL, trading_day, cached_price_histories, build_field_matrix, with_date_index
+from comparison import compute_comparison
+from symbol_directory import get_directory
+from batch_analysis import MAX_SYMBOLS, compare
+
+# Cấu hình trang
+st.set_page_config(
+    page_title="So sánh cổ phiếu",
+    page_icon="📊",
+    layout="wide"
+)
+
+# Giới hạn số mã trong danh sách theo dõi
+MAX_WATCHLIST = 500
+
+# Số ngày lịch sử giá (dùng chung cho so sánh và AI so sánh để đọc cùng một cache)
+HISTORY_DAYS = 1000
+
+# Số kết quả so sánh giữ trong RAM mỗi tiến trình (mỗi cặp danh sách mã x cửa sổ là một kết quả) và thời gian giữ
+COMPARISON_CACHE_ENTRIES = 8
+COMPARISON_CACHE_TTL = "1h"
+
+DEFAULT_WATCHLIST = "VNM, VCB, FPT, HPG, VHM, VIC, MWG, VRE, GAS, MSN, TCB, VPB, POW, SSI"
+
+
+def parse_watchlist(text):
+    """Tách danh sách mã (phân cách bởi dấu phẩy, khoảng trắng hoặc xuống dòng)"""
+    symbols = []
+    for token in text.replace(",", " ").split():
+        token = token.strip().upper()
+        if token and token not in symbols and token != INDEX_SYMBOL:
+            symbols.append(token)
+    return symbols[:MAX_WATCHLIST]
+
+
+def get_api_key():
+    """API key: lấy từ phiên hiện tại (đã nhập ở trang chính) hoặc file cấu hình"""
+    if st.session_state.get("openai_api_key"):
+        return st.session_state.openai_api_key
+    if os.path.exists("config.json"):
+        try:
+            with open("config.json", 'r') as f:
+                return json.load(f).get("openai_api_key", "")
+        except (OSError, ValueError):
+            return ""
+    return ""
+
+
+@st.cache_data(show_spinner=False, max_entries=COMPARISON_CACHE_ENTRIES, ttl=COMPARISON_CACHE_TTL)
+def load_comparison(symbols, source, days, window, day):
+    """
+    Tính so sánh cho cả danh sách theo dõi trên giá đã cache theo từng mã
+    `day` chỉ dùng làm khóa cache: sang ngày giao dịch mới thì tính lại
+    """
+    histories, errors = cached_price_histories(list(symbols), source=source, days=days)
+    index, index_errors = cached_price_histories([INDEX_SYMBOL], source=source, days=days)
+    if not index:
+        # Một số nguồn không có dữ liệu chỉ số, thử lại với VCI
+        index, index_errors = cached_price_histories([INDEX_SYMBOL], source="VCI", days=days)
+    if not index:
+        raise RuntimeError(f"Không tải được {INDEX_SYMBOL}: {index_errors.get(INDEX_SYMBOL)}")
+
+    index_close = with_date_index(index[INDEX_SYMBOL])['close']
+    index_close = index_close[~index_close.index.duplicated(keep='last')].sort_index()
+    closes = build_field_matrix(histories, 'close')
+    result = compute_comparison(closes, index_close, window=window)
+    result["index_close"] = index_close
+    result["errors"] = errors
+    return result
+
+
+# Title
+st.title("📊 So sánh cổ phiếu")
+st.markdown("---")
+
+# Sidebar
+st.sidebar.header("⚙️ Danh sách theo dõi")
+
+with st.sidebar.form(key="watchlist_form"):
+    watchlist_text = st.text_area("Mã chứng khoán", value=DEFAULT_WATCHLIST, height=150,
+                                  help=f"Tối đa {MAX_WATCHLIST} mã, phân cách bởi dấu phẩy")
+    source = st.selectbox("Nguồn dữ liệu", ["TCBS", "VCI", "MSN"])
+    window = st.slider("Cửa sổ tương quan/beta (phiên)", 20, 250, 60, step=10)
+    st.form_submit_button("📥 Tải dữ liệu", type="primary", use_container_width=True)
+
+symbols = parse_watchlist(watchlist_text)
+
+# Bỏ mã không có trong danh bạ trước khi tải (không tốn lượt gọi mạng cho mã gõ sai)
+symbol_directory = get_directory()
+if symbol_directory is not None:
+    unknown = [s for s in symbols if s not in symbol_directory]
+    if unknown:
+        hints = [f"{s} (gợi ý: {', '.join(symbol_directory.search(s, limit=3)) or '-'})" for s in unknown]
+        st.warning("⚠️ Mã không tồn tại, đã bỏ qua: " + "; ".join(hints))
+        symbols = [s for s in symbols if s in symbol_directory]
+
+if not symbols:
+    st.info("💡 Nhập danh sách mã ở sidebar để bắt đầu so sánh")
+    st.stop()
+
+try:
+    with st.spinner(f"Đang tải dữ liệu {len(symbols)} mã..."):
+        result = load_comparison(tuple(symbols), source, HISTORY_DAYS, window, trading_day())
+except Exception as e:
+    st.error(f"❌ Lỗi: {str(e)}")
+    st.info("Vui lòng kiểm tra lại danh sách mã hoặc kết nối internet.")
+    st.stop()
+
+if result["errors"]:
+    with st.expander(f"⚠️ {len(result['errors'])} mã không tải được"):
+        st.write(", ".join(sorted(result["errors"])))
+
+loaded = list(result["closes"].columns)
+if not loaded:
+    st.warning("Không có dữ liệu giá!")
+    st.stop()
+
+selected = st.multiselect("Chọn mã để so sánh", loaded, default=loaded[:5])
+if not selected:
+    st.info("💡 Chọn ít nhất một mã")
+    st.stop()
+
+tab1, tab2, tab3, tab4 = st.tabs(["🔥 Tương quan", "📈 Sức mạnh tương đối", "β Beta & tương quan VNINDEX", "📋 Bảng tổng hợp"])
+
+# TAB 1: Heatmap tương quan
+with tab1:
+    corr = result["correlation"].loc[selected, selected]
+    fig = go.Figure(data=go.Heatmap(
+        z=corr.values,
+        x=selected,
+        y=selected,
+        zmin=-1,
+        zmax=1,
+        colorscale="RdBu",
+        text=corr.round(2).values,
+        texttemplate="%{text}"
+    ))
+    fig.update_layout(
+        title=f"Tương quan lợi suất {window} phiên gần nhất",
+        height=max(400, 40 * len(selected)),
+        template="plotly_white"
+    )
+    st.plotly_chart(fig, use_container_width=True)
+
+# TAB 2: Sức mạnh tương đối
+with tab2:
+    rs = result["relative_strength"][selected]
+    fig_rs = go.Figure()
+    for code in selected:
+        fig_rs.add_trace(go.Scatter(x=rs.index, y=rs[code], name=code, mode="lines"))
+    fig_rs.add_hline(y=1, line_dash="dash", line_color="gray")
+    fig_rs.update_layout(
+        title="Sức mạnh tương đối so với VNINDEX (>1: mạnh hơn thị trường)",
+        yaxis_title="RS",
+        xaxis_title="Ngày",
+        height=500,
+        template="plotly_white"
+    )
+    st.plotly_chart(fig_rs, use_container_width=True)
+
+# TAB 3: Beta và tương quan trượt
+with tab3:
+    col1, col2 = st.columns(2)
+    with col1:
+        beta = result["rolling_beta"][selected]
+        fig_beta = go.Figure()
+        for code in selected:
+            fig_beta.add_trace(go.Scatter(x=beta.index, y=beta[code], name=code, mode="lines"))
+        fig_beta.update_layout(title=f"Beta trượt {window} phiên", height=400, template="plotly_white")
+        st.plotly_chart(fig_beta, use_container_width=True)
+    with col2:
+        rolling_corr = result["rolling_correlation"][selected]
+        fig_corr = go.Figure()
+        for code in selected:
+            fig_corr.add_trace(go.Scatter(x=rolling_corr.index, y=rolling_corr[code], name=code, mode="lines"))
+        fig_corr.update_layout(title=f"Tương quan trượt {window} phiên với VNINDEX", height=400, template="plotly_white")
+        st.plotly_chart(fig_corr, use_container_width=True)
+
+# TAB 4: Bảng tổng hợp toàn bộ danh sách
+with tab4:
+    st.dataframe(result["summary"].round(2), use_container_width=True)
+
+# ==================== AI SO SÁNH (MỘT LỜI GỌI CHO CẢ NHÓM) ====================
+st.markdown("---")
+st.subheader("🤖 AI so sánh các mã đã chọn")
+
+api_key = get_api_key()
+if not api_key:
+    st.warning("⚠️ Vui lòng nhập OpenAI API Key ở trang chính để sử dụng tính năng AI")
+else:
+    ai_symbols = selected[:MAX_SYMBOLS]
+    if len(selected) > MAX_SYMBOLS:
+        st.caption(f"Chỉ so sánh {MAX_SYMBOLS} mã đầu tiên: {', '.join(ai_symbols)}")
+    question = st.text_input("Câu hỏi", value="So sánh và xếp hạng các mã theo xu hướng, động lượng và rủi ro")
+
+    if st.button("🤖 Phân tích so sánh", type="primary", key="batch_ai_button"):
+        # Giá các mã này đã được tải khi so sánh: đọc lại từ cache, không gọi mạng thêm
+        histories, load_errors = cached_price_histories(ai_symbols, source=source, days=HISTORY_DAYS)
+        if not histories:
+            st.session_state.pop("batch_analysis", None)
+            st.error("❌ Không tải được dữ liệu giá: " +
+                     "; ".join(f"{code}: {error}" for code, error in load_errors.items()))
+        else:
+            if load_errors:
+                st.warning(f"⚠️ Bỏ qua mã lỗi: {', '.join(load_errors)}")
+            try:
+                with st.spinner(f"AI đang so sánh {len(histories)} mã..."):
+                    answer, features, messages = compare(OpenAI(api_key=api_key), histories, question)
+                st.session_state.batch_analysis = {
+                    "symbols": ai_symbols,
+                    "source": source,
+                    "answer": answer,
+                    "features": features,
+                    "prompt_chars": sum(len(m["content"]) for m in messages),
+                }
+            except Exception as e:
+                st.error(f"❌ Lỗi: {str(e)}")
+
+    # Chỉ hiện kết quả của đúng lựa chọn hiện tại (đổi mã hoặc nguồn thì phải phân tích lại)
+    analysis = st.session_state.get("batch_analysis")
+    if analysis and (analysis["symbols"] != ai_symbols or analysis.get("source") != source):
+        st.session_state.pop("batch_analysis", None)
+        analysis = None
+    if analysis:
+        st.caption(f"1 lời gọi AI cho {', '.join(analysis['features'].index)} · "
+                   f"prompt {analysis['prompt_chars']:,} ký tự")
+        with st.expander("📋 Dữ liệu đã gửi cho AI"):
+            st.dataframe(analysis["features"].round(2), use_container_width=True)
+        st.markdown(analysis["answer"])
+
+# Footer
+st.sidebar.markdown("---")
+st.sidebar.caption(f"Dữ liệu cache theo ngày giao dịch: {trading_day()}")
+st.sidebar.info("💡 Dữ liệu từ vnstock API")
@@ -0,0 +1,252 @@
+"""
+Snapshot thị trường theo ngày dạng cột, đọc bằng memory-map (dùng chung giữa nhiều worker)
+Xuất snapshot (chạy một lần mỗi ngày, ví dụ bằng cron):
+    python snapshot.py --symbols VNM,FPT,HPG --statements
+    python snapshot.py --symbols-file watchlist.txt
+
+Cấu trúc thư mục:
+    snapshots/
+      LATEST                  # tên snapshot mới nhất (vd: 2024-11-05)
+      2024-11-05/
+        index.json            # danh sách mã, các trường giá
+        dates.npy             # ngày giao dịch (datetime64[D])
+        open.npy ... volume.npy   # ma trận mã x ngày (float64), mỗi mã một dòng liền nhau
+        statements/           # báo cáo tài chính dạng dài (xem columnar.py)
+
+Các worker Streamlit mở file với mmap_mode='r': hệ điều hành chia sẻ các trang
+bộ nhớ giữa các tiến trình nên mỗi worker gần như không tốn thêm RAM cho dữ liệu giá
+"""
+
+import os
+import re
+import json
+import shutil
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from columnar import save_table, load_table, table_frame
+
+# Thư mục chứa snapshot (có thể đổi bằng biến môi trường)
+SNAPSHOT_DIR = os.environ.get("TROLYSTOCK_SNAPSHOT_DIR", "snapshots")
+LATEST_FILE = "LATEST"
+INDEX_FILE = "index.json"
+PRICE_FIELDS = ["open", "high", "low", "close", "volume"]
+
+# Số snapshot theo ngày giữ lại trên đĩa khi xuất bản mới
+KEEP_SNAPSHOTS = 5
+
+# Snapshot đã mở trong tiến trình này (mỗi snapshot chỉ map một lần, giữ tối đa MAX_OPENED bản)
+MAX_OPENED = 2
+_opened = {}
+_opened_lock = threading.Lock()
+
+
+class MarketSnapshot:
+    """Snapshot đã map vào bộ nhớ (chỉ đọc)"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, INDEX_FILE), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.date = self.meta["date"]
+        self.source = self.meta.get("source")
+        self.start = self.meta.get("start")
+        self.symbols = self.meta["symbols"]
+        self._positions = {s: i for i, s in enumerate(self.symbols)}
+        self.dates = np.load(os.path.join(path, "dates.npy"), mmap_mode='r')
+        self.fields = {
+            field: np.load(os.path.join(path, f"{field}.npy"), mmap_mode='r')
+            for field in self.meta["fields"]
+        }
+        self._statements = None
+        if os.path.isdir(os.path.join(path, "statements")):
+            self._statements = load_table(os.path.join(path, "statements"))
+
+    def __contains__(self, symbol):
+        return symbol in self._positions
+
+    def serves(self, source, start=None):
+        """Dùng thay được lời gọi vnstock không: cùng nguồn dữ liệu và lịch sử phủ từ ngày `start`"""
+        if self.source != source:
+            return False
+        if start is None:
+            return True
+        return self.start is not None and pd.Timestamp(self.start) <= pd.Timestamp(start).normalize()
+
+    def history(self, symbol, start=None, end=None):
+        """Dữ liệu giá của một mã, cùng định dạng với stock.quote.history của vnstock"""
+        position = self._positions.get(symbol)
+        if position is None:
+            return None
+        dates = pd.to_datetime(np.asarray(self.dates))
+        mask = ~np.isnan(self.fields["close"][position])
+        # So theo ngày như vnstock (start/end dạng YYYY-MM-DD, lấy cả hai đầu), bỏ giờ trong ngày
+        if start is not None:
+            mask &= dates >= pd.Timestamp(start).normalize()
+        if end is not None:
+            mask &= dates <= pd.Timestamp(end).normalize()
+        data = {"time": dates[mask]}
+        for field in self.meta["fields"]:
+            # Mỗi mã là một dòng liền nhau trong file nên chỉ đọc đúng các trang của mã đó
+            data[field] = self.fields[field][position][mask]
+        return pd.DataFrame(data).reset_index(drop=True)
+
+    def matrix(self, field='close', symbols=None):
+        """Ma trận ngày x mã của một trường giá (mặc định toàn bộ mã)"""
+        symbols = [s for s in (symbols or self.symbols) if s in self._positions]
+        positions = [self._positions[s] for s in symbols]
+        values = self.fields[field][positions].T
+        return pd.DataFrame(values, index=pd.to_datetime(np.asarray(self.dates)), columns=symbols)
+
+    def statements(self, symbol):
+        """Báo cáo tài chính dạng dài của một mã (None nếu snapshot không có)"""
+        if self._statements is None:
+            return None
+        columns, categories = self._statements
+        if symbol not in categories["symbol"]:
+            return None
+        # Bảng được sắp theo mã nên chỉ cần tìm đoạn dòng của mã bằng searchsorted
+        code = categories["symbol"].index(symbol)
+        codes = columns["symbol"]
+        rows = slice(np.searchsorted(codes, code, 'left'), np.searchsorted(codes, code, 'right'))
+        frame = table_frame(columns, categories, rows)
+        return frame.astype({"symbol": str, "report": str, "item": str})
+
+
+def _prune(root, keep, current):
+    """Xóa các snapshot theo ngày cũ, chỉ giữ `keep` bản mới nhất (luôn giữ bản vừa xuất)"""
+    dated = sorted(name for name in os.listdir(root)
+                   if re.fullmatch(r"\d{4}-\d{2}-\d{2}", name) and os.path.isdir(os.path.join(root, name)))
+    for name in dated[:-keep] if keep > 0 else dated:
+        if name != current:
+            # Worker khác có thể đang map file (Windows không cho xóa): bỏ qua, lần xuất sau xóa tiếp
+            shutil.rmtree(os.path.join(root, name), ignore_errors=True)
+
+
+def export_snapshot(histories, statements=None, root=SNAPSHOT_DIR, date=None, source=None, days=None,
+                    keep=KEEP_SNAPSHOTS):
+    """
+    Ghi snapshot từ dict mã -> DataFrame giá (và dict mã -> báo cáo dạng dài nếu có)
+    Ghi vào thư mục tạm rồi đổi tên, worker đang đọc snapshot cũ không bị ảnh hưởng
+    `source`, `days`: nguồn và số ngày lịch sử đã tải, ghi vào index.json để app chỉ dùng
+    snapshot cho đúng nguồn và khoảng thời gian mà nó phủ
+    """
+    from market_data import build_field_matrix, trading_day
+
+    date = date or trading_day()
+    symbols = sorted(histories)
+    closes = build_field_matrix({s: histories[s] for s in symbols}, 'close')
+
+    os.makedirs(root, exist_ok=True)
+    target = os.path.join(root, date)
+    tmp = os.path.join(root, f".{date}.tmp-{os.getpid()}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    np.save(os.path.join(tmp, "dates.npy"), closes.index.values.astype('datetime64[D]'))
+    for field in PRICE_FIELDS:
+        matrix = build_field_matrix({s: histories[s] for s in symbols}, field).reindex(closes.index)
+        # Lưu dạng mã x ngày (C-order) để dữ liệu một mã nằm liền nhau
+        np.save(os.path.join(tmp, f"{field}.npy"), np.ascontiguousarray(matrix.to_numpy(dtype=np.float64).T))
+
+    if statements:
+        frames = [f for f in statements.values() if f is not None and not f.empty]
+        if frames:
+            table = pd.concat(frames, ignore_index=True).sort_values("symbol", kind="stable")
+            save_table(os.path.join(tmp, "statements"), table.reset_index(drop=True))
+
+    with open(os.path.join(tmp, INDEX_FILE), 'w', encoding='utf-8') as f:
+        start = (pd.Timestamp(date) - pd.Timedelta(days=days)).strftime('%Y-%m-%d') if days else None
+        json.dump({"date": date, "source": source, "start": start, "symbols": symbols, "fields": PRICE_FIELDS}, f)
+
+    if os.path.exists(target):
+        shutil.rmtree(target)
+    os.rename(tmp, target)
+
+    # Cập nhật con trỏ LATEST bằng os.replace (nguyên tử)
+    latest_tmp = os.path.join(root, f".{LATEST_FILE}.tmp-{os.getpid()}")
+    with open(latest_tmp, 'w') as f:
+        f.write(date)
+    os.replace(latest_tmp, os.path.join(root, LATEST_FILE))
+    _prune(root, keep, date)
+    return target
+
+
+def load_snapshot(root=SNAPSHOT_DIR, date=None):
+    """Mở snapshot (mới nhất nếu không chỉ định ngày); trả về None nếu chưa có"""
+    if date is None:
+        try:
+            with open(os.path.join(root, LATEST_FILE), 'r') as f:
+                date = f.read().strip()
+        except OSError:
+            return None
+
+    path = os.path.join(root, date)
+    try:
+        # Xuất lại cùng ngày sẽ đổi mtime của index.json -> map lại bản mới
+        key = (path, os.stat(os.path.join(path, INDEX_FILE)).st_mtime_ns)
+    except OSError:
+        return None
+    # Gọi từ nhiều luồng (fetch_price_histories): tra và thêm dưới khóa để mỗi bản chỉ map một lần
+    with _opened_lock:
+        snapshot = _opened.get(key)
+        if snapshot is None:
+            snapshot = MarketSnapshot(path)
+            # Bỏ bản map cũ của cùng ngày (đã xuất lại) và các bản cũ nhất vượt MAX_OPENED;
+            # phiên đang dùng bản cũ vẫn giữ tham chiếu riêng tới khi xong
+            for old in [k for k in _opened if k[0] == path]:
+                _opened.pop(old, None)
+            _opened[key] = snapshot
+            while len(_opened) > MAX_OPENED:
+                _opened.pop(next(iter(_opened)), None)
+    return snapshot
+
+
+def main():
+    """Tải dữ liệu và xuất snapshot theo ngày"""
+    from market_data import STATEMENT_REPORTS, fetch_price_histories, fetch_statement, normalize_statement
+
+    parser = argparse.ArgumentParser(description="Xuất snapshot thị trường theo ngày")
+    parser.add_argument("--symbols", default="", help="Danh sách mã, phân cách bởi dấu phẩy")
+    parser.add_argument("--symbols-file", help="File chứa danh sách mã (mỗi dòng một mã)")
+    parser.add_argument("--source", default="TCBS", help="Nguồn dữ liệu (TCBS, VCI, MSN)")
+    parser.add_argument("--days", type=int, default=1000, help="Số ngày lịch sử")
+    parser.add_argument("--statements", action="store_true", help="Kèm báo cáo tài chính")
+    parser.add_argument("--root", default=SNAPSHOT_DIR, help="Thư mục snapshot")
+    parser.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS, help="Số snapshot theo ngày giữ lại")
+    args = parser.parse_args()
+
+    symbols = [s.strip().upper() for s in args.symbols.split(",") if s.strip()]
+    if args.symbols_file:
+        with open(args.symbols_file, 'r', encoding='utf-8') as f:
+            symbols += [line.strip().upper() for line in f if line.strip()]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        parser.error("Cần ít nhất một mã (--symbols hoặc --symbols-file)")
+
+    print(f"Đang tải giá {len(symbols)} mã...")
+    histories, errors = fetch_price_histories(symbols, source=args.source, days=args.days, use_snapshot=False)
+    for symbol, error in errors.items():
+        print(f"  ⚠️ {symbol}: {error}")
+
+    statements = {}
+    if args.statements:
+        print("Đang tải báo cáo tài chính...")
+        for symbol in histories:
+            frames = []
+            for report in STATEMENT_REPORTS:
+                try:
+                    frames.append(normalize_statement(fetch_statement(symbol, report, source=args.source), symbol, report))
+                except Exception as e:
+                    print(f"  ⚠️ {symbol} {report}: {str(e)}")
+            if frames:
+                statements[symbol] = pd.concat(frames, ignore_index=True)
+
+    target = export_snapshot(histories, statements, root=args.root, source=args.source, days=args.days,
+                             keep=args.keep)
+    print(f"✅ Đã xuất snapshot {len(histories)} mã: {target}")
+
+
+if __name__ == "__main__":
+    main()
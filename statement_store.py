@@ -0,0 +1,377 @@
+"""
+Kho báo cáo tài chính theo quý: mỗi nguồn, mỗi mã một thư mục bảng dạng cột (xem columnar.py)
+Bảng dạng dài, mỗi dòng một chỉ tiêu của một quý:
+    report, item, year, quarter, value, qoq, yoy, ttm
+- Giữ mọi quý đã từng tải, kể cả quý cũ mà nguồn dữ liệu không còn trả về
+- Tách kho theo nguồn: TCBS và VCI đặt tên chỉ tiêu khác nhau, không ghép chung một bảng
+- Chỉ gọi vnstock khi có thể đã có quý mới (đã qua hạn công bố) và chưa kiểm tra trong ngày,
+  chỉ ghép thêm các quý chưa có
+- Tăng trưởng QoQ/YoY và TTM tính một lần khi có quý mới; xem bảng hay hỏi AI chỉ đọc lại
+
+Cấu trúc thư mục:
+    cache/statements/
+      TCBS/
+        VNM/
+          meta.json           # ngày kiểm tra gần nhất (chỉ khi đủ mọi báo cáo), lần thử tải gần nhất, nguồn
+          table/              # bảng dạng cột, sắp theo report, item, year, quarter
+"""
+
+import os
+import json
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from columnar import save_table, load_table, table_frame
+from symbol_directory import normalize
+
+CACHE_DIR = os.environ.get("TROLYSTOCK_CACHE_DIR", "cache")
+STORE_DIR = os.path.join(CACHE_DIR, "statements")
+META_FILE = "meta.json"
+TABLE_DIR = "table"
+
+# BCTC quý hợp nhất công bố chậm nhất 45 ngày sau khi kết thúc quý
+PUBLISH_LAG_DAYS = 45
+
+# Còn thiếu báo cáo (lần tải trước lỗi): chờ bao lâu rồi mới thử tải lại (giây)
+RETRY_INTERVAL = 600
+
+# Báo cáo phát sinh trong kỳ: TTM = tổng 4 quý; báo cáo số dư và chỉ số: TTM = trung bình 4 quý
+FLOW_REPORTS = {"income_statement"}
+# Chỉ số (%, lần): QoQ/YoY là chênh lệch tuyệt đối thay vì % tăng trưởng
+RATIO_REPORTS = {"ratio"}
+
+REPORT_LABELS = {
+    "income_statement": "Kết quả kinh doanh",
+    "balance_sheet": "Cân đối kế toán",
+    "ratio": "Chỉ số tài chính",
+}
+
+# Chỉ tiêu chính gửi cho AI (so khớp không dấu, theo thứ tự ưu tiên)
+KEY_ITEMS = {
+    "income_statement": ["doanh thu", "loi nhuan gop", "loi nhuan sau thue", "loi nhuan"],
+    "balance_sheet": ["tong tai san", "von chu so huu", "no phai tra", "tien"],
+    "ratio": ["p/e", "p/b", "roe", "roa", "eps", "bien loi nhuan", "no/von"],
+}
+PROMPT_ITEMS = 6
+
+# Từ khóa nhận biết câu hỏi phân tích cơ bản (không dấu)
+FUNDAMENTAL_KEYWORDS = ["co ban", "tai chinh", "bctc", "dinh gia", "p/e", "p/b", "roe", "roa", "eps",
+                        "doanh thu", "loi nhuan", "tang truong", "no vay", "co tuc"]
+
+COLUMNS = ["report", "item", "year", "quarter", "value", "qoq", "yoy", "ttm"]
+
+# Tên cột khi hiển thị bảng tăng trưởng
+GROWTH_LABELS = {"value": "Giá trị", "qoq": "QoQ", "yoy": "YoY", "ttm": "TTM"}
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+_locks = {}
+
+
+def period_label(year, quarter):
+    """Nhãn kỳ báo cáo, vd: Q2/2024"""
+    return f"Q{int(quarter)}/{int(year)}"
+
+
+def expected_quarter(now=None):
+    """Quý gần nhất đáng lẽ đã công bố BCTC tính đến hôm nay (year, quarter)"""
+    day = (now or datetime.now()).date() - timedelta(days=PUBLISH_LAG_DAYS)
+    quarter = (day.month - 1) // 3  # quý đã kết thúc trước quý chứa `day`
+    return (day.year - 1, 4) if quarter == 0 else (day.year, quarter)
+
+
+def is_fundamental_question(text):
+    """Câu hỏi có liên quan phân tích cơ bản (cần kèm số liệu BCTC)"""
+    text = normalize(text)
+    return any(keyword in text for keyword in FUNDAMENTAL_KEYWORDS)
+
+
+def compute_trends(raw):
+    """
+    Tính QoQ, YoY (so với cùng kỳ năm trước) và TTM cho bảng dạng dài
+    Chỉ so với đúng quý liền trước / cùng kỳ: thiếu quý nào thì kết quả là NaN
+    """
+    data = (raw[["report", "item", "year", "quarter", "value"]]
+            .drop_duplicates(["report", "item", "year", "quarter"], keep="last")
+            .sort_values(["report", "item", "year", "quarter"])
+            .reset_index(drop=True))
+    period = data["year"].to_numpy(dtype=np.int64) * 4 + data["quarter"].to_numpy(dtype=np.int64) - 1
+    values = data["value"].to_numpy(dtype=np.float64)
+    lookup = pd.Series(values, index=pd.MultiIndex.from_arrays([data["report"], data["item"], period]))
+
+    def _lagged(lag):
+        key = pd.MultiIndex.from_arrays([data["report"], data["item"], period - lag])
+        return lookup.reindex(key).to_numpy(dtype=np.float64)
+
+    previous = [_lagged(lag) for lag in (1, 2, 3, 4)]
+    is_ratio = data["report"].isin(RATIO_REPORTS).to_numpy()
+    is_flow = data["report"].isin(FLOW_REPORTS).to_numpy()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        def _growth(base):
+            change = values - base
+            return np.where(is_ratio, change, change / np.abs(base) * 100)
+
+        qoq, yoy = _growth(previous[0]), _growth(previous[3])
+        total = values + previous[0] + previous[1] + previous[2]
+        ttm = np.where(is_flow, total, total / 4)
+
+    for column in (qoq, yoy, ttm):
+        column[~np.isfinite(column)] = np.nan
+    data["qoq"], data["yoy"], data["ttm"] = qoq, yoy, ttm
+    data["year"] = data["year"].astype(np.int32)
+    data["quarter"] = data["quarter"].astype(np.int32)
+    return data[COLUMNS]
+
+
+class StatementHistory:
+    """Báo cáo tài chính mọi quý của một mã (đọc từ kho, đã có cột tăng trưởng)"""
+
+    def __init__(self, symbol, data, checked=None, source=None, attempted=None):
+        self.symbol = symbol
+        self.data = data
+        self.checked = checked
+        self.source = source
+        self.attempted = attempted
+        self._views = {}
+
+    @classmethod
+    def open(cls, symbol, directory):
+        """Đọc thư mục của một mã; None nếu chưa có"""
+        try:
+            with open(os.path.join(directory, META_FILE), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            # Bảng nhỏ (vài nghìn dòng): đọc hẳn vào RAM để không giữ file khi ghi đè
+            columns, categories = load_table(os.path.join(directory, TABLE_DIR), mmap_mode=None)
+        except (OSError, ValueError):
+            return None
+        data = table_frame(columns, categories).astype({"report": str, "item": str})
+        return cls(symbol, data, meta.get("checked"), meta.get("source"), meta.get("attempted"))
+
+    @property
+    def empty(self):
+        return self.data.empty
+
+    def reports(self):
+        """Các loại báo cáo đang có dữ liệu"""
+        return [r for r in REPORT_LABELS if r in set(self.data["report"])]
+
+    @property
+    def complete(self):
+        """Đã có đủ mọi loại báo cáo trong STATEMENT_REPORTS"""
+        from market_data import STATEMENT_REPORTS
+        return set(STATEMENT_REPORTS) <= set(self.reports())
+
+    def frame(self, report):
+        """Bảng dạng dài của một loại báo cáo"""
+        if ("frame", report) not in self._views:
+            self._views["frame", report] = self.data[self.data["report"] == report].reset_index(drop=True)
+        return self._views["frame", report]
+
+    def latest_period(self, report=None):
+        """Quý mới nhất (year, quarter); không chỉ định report thì lấy quý cũ nhất trong các quý mới nhất"""
+        if self.empty:
+            return None
+        reports = [report] if report else self.reports()
+        latest = [max(zip(self.frame(r)["year"], self.frame(r)["quarter"]), default=None) for r in reports]
+        latest = [p for p in latest if p is not None]
+        return tuple(int(x) for x in min(latest)) if latest else None
+
+    def view(self, report, field="value", quarters=8):
+        """Bảng rộng: mỗi dòng một chỉ tiêu, mỗi cột một quý (mới nhất bên trái)"""
+        key = ("view", report, field, quarters)
+        if report not in self.reports():
+            # Báo cáo chưa tải được (nguồn lỗi): bảng rỗng
+            return pd.DataFrame()
+        if key not in self._views:
+            data = self.frame(report)
+            periods = sorted(set(zip(data["year"], data["quarter"])), reverse=True)[:quarters]
+            data = data[pd.MultiIndex.from_arrays([data["year"], data["quarter"]]).isin(periods)]
+            table = data.pivot(index="item", columns=["year", "quarter"], values=field)
+            table = table.reindex(columns=pd.MultiIndex.from_tuples(periods))
+            table.columns = [period_label(y, q) for y, q in periods]
+            # Xếp chỉ tiêu theo tên để thứ tự ổn định giữa các lần đọc
+            self._views[key] = table.sort_index()
+        return self._views[key]
+
+    def latest(self, report):
+        """Quý mới nhất của một báo cáo: giá trị, QoQ, YoY, TTM theo từng chỉ tiêu"""
+        period = self.latest_period(report)
+        if period is None:
+            return pd.DataFrame(columns=["value", "qoq", "yoy", "ttm"])
+        data = self.frame(report)
+        rows = data[(data["year"] == period[0]) & (data["quarter"] == period[1])]
+        return rows.set_index("item")[["value", "qoq", "yoy", "ttm"]]
+
+    def key_items(self, report, limit=PROMPT_ITEMS):
+        """Chỉ tiêu chính của báo cáo theo KEY_ITEMS (tối đa `limit`, None = tất cả)"""
+        items = sorted(set(self.frame(report)["item"]))
+        normalized = {item: normalize(item) for item in items}
+        selected = []
+        for keyword in KEY_ITEMS.get(report, []):
+            for item in items:
+                if keyword in normalized[item] and item not in selected:
+                    selected.append(item)
+        return selected[:limit]
+
+    def summary(self, limit=PROMPT_ITEMS):
+        """Tóm tắt ngắn các chỉ tiêu chính quý gần nhất để gửi cho AI"""
+        lines = []
+        for report in self.reports():
+            period = self.latest_period(report)
+            latest = self.latest(report)
+            # Chỉ tiêu thiếu ở quý gần nhất (nguồn bỏ trống) thì bỏ qua
+            items = [item for item in self.key_items(report, limit=None) if item in latest.index][:limit]
+            if not items:
+                continue
+            growth = "chênh lệch" if report in RATIO_REPORTS else "%"
+            lines.append(f"{REPORT_LABELS[report]} ({period_label(*period)}; QoQ/YoY: {growth}):")
+            for item in items:
+                row = latest.loc[item]
+                parts = [f"{row['value']:,.2f}"]
+                for name in ("qoq", "yoy"):
+                    if pd.notna(row[name]):
+                        parts.append(f"{GROWTH_LABELS[name]} {row[name]:+,.1f}")
+                if pd.notna(row["ttm"]):
+                    parts.append(f"TTM {row['ttm']:,.2f}")
+                lines.append(f"- {item}: " + " | ".join(parts))
+        return "\n".join(lines)
+
+
+def _directory(symbol, source, root):
+    return os.path.join(root, source, symbol)
+
+
+def _read(symbol, source, root):
+    """Đọc bản đã lưu, giữ trong RAM theo mtime của meta.json"""
+    directory = _directory(symbol, source, root)
+    try:
+        key = (directory, os.stat(os.path.join(directory, META_FILE)).st_mtime_ns)
+    except OSError:
+        return None
+    with _loaded_lock:
+        history = _loaded.get(key)
+        if history is None:
+            history = StatementHistory.open(symbol, directory)
+            # Bỏ bản cũ của cùng mã (meta.json đã ghi lại) để không giữ mãi trong RAM
+            for old in [k for k in _loaded if k[0] == directory]:
+                _loaded.pop(old, None)
+            _loaded[key] = history
+    return history
+
+
+def _write_meta(directory, meta):
+    tmp = os.path.join(directory, f".{META_FILE}.tmp-{os.getpid()}-{threading.get_ident()}")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(directory, META_FILE))
+
+
+def _write(symbol, source, root, table, meta):
+    """Ghi bảng vào thư mục tạm rồi đổi chỗ với bản cũ"""
+    directory = _directory(symbol, source, root)
+    os.makedirs(directory, exist_ok=True)
+    suffix = f"{os.getpid()}-{threading.get_ident()}"
+    tmp = os.path.join(directory, f".{TABLE_DIR}.tmp-{suffix}")
+    old = os.path.join(directory, f".{TABLE_DIR}.old-{suffix}")
+    shutil.rmtree(tmp, ignore_errors=True)
+    save_table(tmp, table)
+
+    target = os.path.join(directory, TABLE_DIR)
+    try:
+        if os.path.exists(target):
+            os.rename(target, old)
+        os.rename(tmp, target)
+    except OSError:
+        # Worker khác vừa ghi cùng mã (cùng dữ liệu nguồn): giữ bản của worker đó
+        shutil.rmtree(tmp, ignore_errors=True)
+    shutil.rmtree(old, ignore_errors=True)
+    _write_meta(directory, meta)
+
+
+def _download(symbol, source):
+    """
+    Tải các báo cáo dạng dài: ưu tiên snapshot trong ngày (cùng nguồn), không có thì gọi vnstock song song
+    Trả về (DataFrame, lỗi đầu tiên); báo cáo lỗi được bỏ qua
+    """
+    from market_data import STATEMENT_REPORTS, current_snapshot, fetch_statement, normalize_statement, trading_day
+
+    snapshot = current_snapshot()
+    if snapshot is not None and snapshot.date >= trading_day() and snapshot.serves(source):
+        statements = snapshot.statements(symbol)
+        if statements is not None and not statements.empty:
+            return statements, None
+
+    def _fetch(report):
+        try:
+            return normalize_statement(fetch_statement(symbol, report, source=source), symbol, report), None
+        except Exception as e:
+            return None, e
+
+    with ThreadPoolExecutor(max_workers=len(STATEMENT_REPORTS)) as executor:
+        results = list(executor.map(_fetch, STATEMENT_REPORTS))
+    frames = [frame for frame, _ in results if frame is not None and not frame.empty]
+    error = next((e for _, e in results if e is not None), None)
+    return (pd.concat(frames, ignore_index=True) if frames else None), error
+
+
+def get_statements(symbol, source="TCBS", root=STORE_DIR, now=None):
+    """
+    Báo cáo tài chính mọi quý của một mã
+    Đọc từ kho; chỉ tải lại khi quý mới nhất đã lưu cũ hơn quý đáng lẽ đã công bố
+    và chưa kiểm tra trong ngày giao dịch hiện tại. Kho còn thiếu báo cáo (lần trước tải lỗi)
+    thì không tính là đã kiểm tra: thử tải lại sau RETRY_INTERVAL.
+    Tải lỗi thì dùng bản đã lưu (nếu có)
+    """
+    from market_data import trading_day
+
+    symbol = symbol.upper()
+    today = trading_day(now)
+    timestamp = (now or datetime.now()).timestamp()
+
+    def _fresh(history):
+        if history is None:
+            return False
+        if not history.complete:
+            return timestamp < (history.attempted or 0) + RETRY_INTERVAL
+        return history.checked == today or (history.latest_period() or (0, 0)) >= expected_quarter(now)
+
+    history = _read(symbol, source, root)
+    if _fresh(history):
+        return history
+
+    with _locks.setdefault((symbol, source), threading.Lock()):
+        history = _read(symbol, source, root)
+        if _fresh(history):
+            return history
+
+        downloaded, error = _download(symbol, source)
+        if downloaded is None:
+            if history is not None:
+                _write_meta(_directory(symbol, source, root),
+                            {"checked": history.checked, "source": source, "attempted": timestamp})
+                return _read(symbol, source, root)
+            raise error or LookupError(f"Không có báo cáo tài chính cho {symbol}")
+
+        downloaded = downloaded[["report", "item", "year", "quarter", "value"]]
+        if history is not None and not history.empty:
+            # Chỉ ghép các quý chưa có của từng báo cáo
+            stored = pd.MultiIndex.from_frame(history.data[["report", "year", "quarter"]].drop_duplicates())
+            new_rows = downloaded[~pd.MultiIndex.from_frame(downloaded[["report", "year", "quarter"]]).isin(stored)]
+            merged = pd.concat([history.data[["report", "item", "year", "quarter", "value"]], new_rows],
+                               ignore_index=True)
+        else:
+            new_rows = merged = downloaded
+
+        # Chỉ đánh dấu đã kiểm tra trong ngày khi kho có đủ mọi báo cáo
+        from market_data import STATEMENT_REPORTS
+        complete = set(STATEMENT_REPORTS) <= set(merged["report"])
+        meta = {"checked": today if complete else None, "source": source, "attempted": timestamp}
+        if new_rows.empty:
+            _write_meta(_directory(symbol, source, root), meta)
+        else:
+            _write(symbol, source, root, compute_trends(merged), meta)
+        return _read(symbol, source, root)
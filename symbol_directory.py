@@ -0,0 +1,241 @@
+"""
+Danh bạ mã chứng khoán: tìm nhanh theo mã hoặc tên công ty, kiểm tra mã trước khi tải dữ liệu
+Danh sách lấy từ listing.all_symbols(), lưu trên đĩa và làm mới mỗi ngày giao dịch.
+Chỉ mục trong RAM:
+    - Tiền tố mã và tiền tố từng từ trong tên (danh sách đã sắp xếp + bisect)
+    - Gõ sai 1 ký tự (symmetric delete: tra bảng các biến thể xóa 1 ký tự)
+"""
+
+import os
+import json
+import time
+import heapq
+import bisect
+import threading
+import unicodedata
+from collections import defaultdict
+
+CACHE_DIR = os.environ.get("TROLYSTOCK_CACHE_DIR", "cache")
+LISTING_FILE = os.path.join(CACHE_DIR, "symbols.json")
+
+# Tên cột mã / tên công ty tùy nguồn dữ liệu
+SYMBOL_COLUMNS = ["symbol", "ticker"]
+NAME_COLUMNS = ["organ_name", "organName", "company_name", "short_name"]
+
+# Mã chỉ số không có trong listing.all_symbols() nhưng vẫn tra cứu được giá
+INDEX_NAMES = {
+    "VNINDEX": "Chỉ số VN-Index",
+    "VN30": "Chỉ số VN30",
+    "VN100": "Chỉ số VN100",
+    "HNXINDEX": "Chỉ số HNX-Index",
+    "HNX30": "Chỉ số HNX30",
+    "UPCOMINDEX": "Chỉ số UPCoM-Index",
+}
+
+# Thời gian chờ trước khi thử tải lại danh sách khi lần tải trước lỗi (giây)
+RETRY_INTERVAL = 600
+
+# Từ quá ngắn trong tên không đưa vào chỉ mục gõ sai (tránh gợi ý nhiễu)
+MIN_FUZZY_TOKEN = 4
+
+_directory = None
+_retry_at = 0
+_lock = threading.Lock()
+
+
+def normalize(text):
+    """Chữ thường, bỏ dấu tiếng Việt (đ -> d) để tìm không cần gõ dấu"""
+    text = str(text).lower().replace("đ", "d")
+    return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+
+
+def _deletes(word):
+    """Các biến thể xóa đúng 1 ký tự"""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def _prefix_range(sorted_keys, prefix):
+    """Các khóa có tiền tố `prefix` trong danh sách đã sắp xếp"""
+    start = bisect.bisect_left(sorted_keys, prefix)
+    end = bisect.bisect_left(sorted_keys, prefix + "\uffff")
+    return sorted_keys[start:end]
+
+
+class SymbolDirectory:
+    """Chỉ mục mã và tên công ty"""
+
+    def __init__(self, entries, date=None):
+        self.date = date
+        self.names = {**INDEX_NAMES, **dict(entries)}
+        self.tickers = sorted(self.names)
+
+        self._tokens = defaultdict(set)
+        self._fuzzy = defaultdict(set)
+        for ticker, name in self.names.items():
+            for variant in _deletes(ticker):
+                self._fuzzy[variant.lower()].add(ticker)
+            for token in normalize(name).split():
+                self._tokens[token].add(ticker)
+                if len(token) >= MIN_FUZZY_TOKEN:
+                    for variant in _deletes(token):
+                        self._fuzzy[variant].add(ticker)
+        self._token_keys = sorted(self._tokens)
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self.names
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def label(self, ticker):
+        """Nhãn hiển thị: MÃ - Tên công ty"""
+        name = self.names.get(ticker)
+        return f"{ticker} - {name}" if name else ticker
+
+    def _name_matches(self, query, limit=None):
+        """
+        Mã có tên chứa mọi từ của câu nhập (khớp tiền tố từng từ), theo thứ tự chữ cái
+        `limit`: dừng khi đủ số mã (từ chung như "cong", "ty" khớp gần hết danh sách)
+        """
+        groups = []
+        for word in set(query.split()):
+            sets = [self._tokens[token] for token in _prefix_range(self._token_keys, word)]
+            if not sets:
+                return []
+            groups.append(sets)
+        if not groups:
+            return []
+
+        # Duyệt ứng viên từ từ hiếm nhất; từ quá chung thì duyệt danh sách mã đã sắp xếp
+        groups.sort(key=lambda sets: sum(map(len, sets)))
+        rarest = set().union(*groups[0]) if len(groups[0]) > 1 else groups[0][0]
+        candidates = self.tickers if len(rarest) * 8 > len(self.tickers) else sorted(rarest)
+        matched = []
+        for ticker in candidates:
+            if all(any(ticker in s for s in sets) for sets in groups):
+                matched.append(ticker)
+                if limit is not None and len(matched) >= limit:
+                    break
+        return matched
+
+    def search(self, query, limit=10):
+        """
+        Tìm mã theo thứ tự ưu tiên: trùng mã, tiền tố mã, tiền tố từ trong tên, gõ sai 1 ký tự
+        Câu nhiều từ: mọi từ phải khớp tiền tố một từ trong tên
+        """
+        query = normalize(query).strip()
+        if not query:
+            return []
+
+        results = []
+        seen = set()
+
+        def _add(tickers, key=None):
+            # Chỉ sắp xếp `limit` mã nhỏ nhất: tên công ty thường chung tiền tố ("Công ty Cổ phần ...")
+            # nên một từ có thể khớp gần hết danh sách
+            for ticker in heapq.nsmallest(limit, tickers, key=key):
+                if len(results) >= limit:
+                    return
+                if ticker not in seen:
+                    seen.add(ticker)
+                    results.append(ticker)
+
+        upper = query.upper()
+        if upper in self.names:
+            _add([upper])
+        _add(_prefix_range(self.tickers, upper)[:limit])
+
+        if len(results) < limit:
+            _add(self._name_matches(query, limit))
+
+        if len(results) < limit:
+            # Gõ sai 1 ký tự: thay/xóa (biến thể xóa của query) và thừa 1 ký tự (query là biến thể xóa)
+            fuzzy = set(self._fuzzy.get(query, ()))
+            for variant in _deletes(query):
+                fuzzy |= self._fuzzy.get(variant, set())
+                if variant.upper() in self.names:
+                    fuzzy.add(variant.upper())
+            # Ưu tiên mã cùng chữ cái đầu, đảo chỗ 2 ký tự, cùng độ dài, nhiều ký tự trùng vị trí
+            _add(fuzzy, key=lambda t: (t[0] != upper[0], sorted(t) != sorted(upper), len(t) != len(upper),
+                                       -sum(a == b for a, b in zip(t, upper)), t))
+
+        return results
+
+    def resolve(self, query):
+        """Mã chính xác cho câu nhập (mã hoặc tên công ty khớp duy nhất); None nếu không xác định được"""
+        if query.upper() in self.names:
+            return query.upper()
+        # Chỉ tự chọn khi tên công ty khớp duy nhất (không tự sửa mã gõ sai)
+        matches = self._name_matches(normalize(query).strip(), limit=2)
+        return matches[0] if len(matches) == 1 else None
+
+
+def listing_entries(data):
+    """Chuyển DataFrame listing của vnstock thành danh sách (mã, tên)"""
+    symbol_col = next((c for c in SYMBOL_COLUMNS if c in data.columns), None)
+    name_col = next((c for c in NAME_COLUMNS if c in data.columns), None)
+    if symbol_col is None:
+        return []
+    names = data[name_col] if name_col else [""] * len(data)
+    return [(str(s).upper(), "" if n is None else str(n)) for s, n in zip(data[symbol_col], names) if s]
+
+
+def _read_cache():
+    try:
+        with open(LISTING_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache(date, entries):
+    """Lưu danh sách xuống đĩa; thư mục cache không ghi được (chỉ đọc, đầy) thì bỏ qua"""
+    tmp = f"{LISTING_FILE}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"date": date, "symbols": entries}, f, ensure_ascii=False)
+        os.replace(tmp, LISTING_FILE)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+
+
+def get_directory(source="VCI"):
+    """
+    Danh bạ mã của ngày giao dịch hiện tại
+    Thứ tự: bản trong RAM -> file cache trên đĩa (cùng ngày) -> tải mới từ vnstock
+    Tải lỗi thì dùng bản cache cũ; không có gì thì trả về None (bỏ qua kiểm tra mã)
+    """
+    global _directory, _retry_at
+    from market_data import fetch_all_symbols, trading_day
+
+    today = trading_day()
+    if (_directory is not None and _directory.date == today) or time.time() < _retry_at:
+        return _directory
+
+    with _lock:
+        if (_directory is not None and _directory.date == today) or time.time() < _retry_at:
+            return _directory
+
+        cached = _read_cache()
+        if cached and cached.get("date") == today:
+            _directory = SymbolDirectory(cached["symbols"], today)
+            return _directory
+
+        try:
+            entries = listing_entries(fetch_all_symbols(source=source))
+        except Exception:
+            entries = []
+
+        if entries:
+            _write_cache(today, entries)
+            _directory = SymbolDirectory(entries, today)
+        else:
+            # Dùng bản cũ (nếu có), thử tải lại sau RETRY_INTERVAL
+            _retry_at = time.time() + RETRY_INTERVAL
+            if cached and _directory is None:
+                _directory = SymbolDirectory(cached["symbols"], cached.get("date"))
+        return _directory
@@ -0,0 +1,156 @@
+"""
+Lớp truyền tải cho các lời gọi ra ngoài (vnstock, OpenAI) với chế độ ghi/phát lại
+Chọn chế độ bằng biến môi trường:
+    TROLYSTOCK_TRANSPORT=live      # mặc định: gọi thật
+    TROLYSTOCK_TRANSPORT=record    # gọi thật và ghi kết quả vào file fixture
+    TROLYSTOCK_TRANSPORT=replay    # chỉ đọc từ file fixture, không gọi mạng
+    TROLYSTOCK_FIXTURES=fixtures/trolystock.zip   # file fixture (zip nén)
+    TROLYSTOCK_REPLAY_LATENCY=200  # độ trễ giả lập khi phát lại (ms)
+
+Ví dụ: ghi một lần rồi chạy lại offline với độ trễ cố định
+    TROLYSTOCK_TRANSPORT=record streamlit run app.py
+    TROLYSTOCK_TRANSPORT=replay TROLYSTOCK_REPLAY_LATENCY=300 streamlit run app.py
+
+Nhiều tiến trình có thể cùng ghi một file fixture: mỗi lần ghi giữ khóa file `<fixture>.lock`
+(khóa của hệ điều hành) và kiểm tra lại bản ghi đã có trong file trước khi thêm
+"""
+
+import os
+import json
+import time
+import pickle
+import hashlib
+import zipfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MODE = os.environ.get("TROLYSTOCK_TRANSPORT", "live").lower()
+FIXTURE_FILE = os.environ.get("TROLYSTOCK_FIXTURES", os.path.join("fixtures", "trolystock.zip"))
+REPLAY_LATENCY = float(os.environ.get("TROLYSTOCK_REPLAY_LATENCY", "0")) / 1000
+
+_lock = threading.Lock()
+_archive = None
+_recorded = None
+
+
+class FixtureMissing(LookupError):
+    """Không có bản ghi cho lời gọi này khi đang ở chế độ replay"""
+
+
+def fixture_key(kind, params):
+    """Khóa ổn định của một lời gọi (loại + tham số)"""
+    raw = json.dumps([kind, params], sort_keys=True, ensure_ascii=False, default=str)
+    return f"{kind}/{hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]}"
+
+
+def _read_archive():
+    """Mở file fixture để đọc (một lần mỗi tiến trình)"""
+    global _archive
+    if _archive is None:
+        if not os.path.exists(FIXTURE_FILE):
+            raise FixtureMissing(f"Không tìm thấy file fixture: {FIXTURE_FILE}")
+        _archive = zipfile.ZipFile(FIXTURE_FILE, 'r')
+    return _archive
+
+
+@contextmanager
+def _file_lock(path):
+    """Khóa độc quyền giữa các tiến trình (file `<path>.lock` bên cạnh file fixture)"""
+    with open(f"{path}.lock", 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _write(name, payload):
+    """Ghi thêm một bản ghi vào file fixture (bỏ qua nếu đã có, kể cả do tiến trình khác ghi)"""
+    global _recorded
+    with _lock:
+        if _recorded is None:
+            _recorded = set()
+        if name in _recorded:
+            return
+        os.makedirs(os.path.dirname(FIXTURE_FILE) or ".", exist_ok=True)
+        with _file_lock(FIXTURE_FILE):
+            with zipfile.ZipFile(FIXTURE_FILE, 'a', compression=zipfile.ZIP_DEFLATED) as archive:
+                if name not in archive.NameToInfo:
+                    archive.writestr(name, payload)
+                _recorded.update(archive.NameToInfo)
+
+
+def _read(key):
+    """Đọc bản ghi theo khóa; trả về (loại bản ghi, nội dung)"""
+    with _lock:
+        archive = _read_archive()
+        for suffix in (".pkl", ".json", ".error"):
+            if key + suffix in archive.NameToInfo:
+                payload = archive.read(key + suffix)
+                break
+        else:
+            raise FixtureMissing(f"Chưa ghi lời gọi {key} trong {FIXTURE_FILE}")
+    if REPLAY_LATENCY:
+        time.sleep(REPLAY_LATENCY)
+    return suffix, payload
+
+
+def call(kind, params, fetch):
+    """
+    Gọi `fetch()` theo chế độ hiện tại
+    record: lưu cả kết quả lẫn lỗi (phát lại sẽ báo lỗi y như lúc ghi)
+    """
+    if MODE == "live":
+        return fetch()
+
+    key = fixture_key(kind, params)
+    if MODE == "replay":
+        suffix, payload = _read(key)
+        if suffix == ".error":
+            raise RuntimeError(payload.decode('utf-8'))
+        return pickle.loads(payload)
+
+    try:
+        result = fetch()
+    except Exception as e:
+        _write(key + ".error", str(e).encode('utf-8'))
+        raise
+    _write(key + ".pkl", pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    return result
+
+
+def chat_completion(client, **kwargs):
+    """client.chat.completions.create qua lớp ghi/phát lại (lưu phản hồi dạng JSON)"""
+    if MODE == "live":
+        return client.chat.completions.create(**kwargs)
+
+    from openai.types.chat import ChatCompletion
+
+    key = fixture_key("chat", kwargs)
+    if MODE == "replay":
+        suffix, payload = _read(key)
+        if suffix == ".error":
+            raise RuntimeError(payload.decode('utf-8'))
+        return ChatCompletion.model_validate(json.loads(payload))
+
+    try:
+        response = client.chat.completions.create(**kwargs)
+    except Exception as e:
+        _write(key + ".error", str(e).encode('utf-8'))
+        raise
+    _write(key + ".json", json.dumps(response.model_dump(), ensure_ascii=False).encode('utf-8'))
+    return response